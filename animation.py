@@ -0,0 +1,184 @@
+#!/usr/bin/python
+"""Animations: sequences of frames played with per-frame timing.
+
+An `Animation` holds its frames packed two bits per pixel (see
+`frame.Frame.pack`) with a delay for each. It can be made from an animated
+GIF or a sequence of PNGs (with PIL installed), or from a raw file of packed
+frames, and is stored in a small file of its own (`.ldpa`) so that an image
+only ever has to be decoded once:
+
+    >>> a = animation.load('logo.gif', s.WIDTH, s.HEIGHT)   # makes logo.gif.ldpa
+    >>> s.animate(a)
+
+Images are quantized to the sign's four colours (off, red, green and
+orange) by nearest colour, with transparent pixels off, and placed centred
+without scaling. The display process compiles each frame into a frame
+program the first time an animation is played and keeps the programs (see
+`worker.Channel`), so playing it again costs nothing but the replay.
+
+The file format is a header (`LDPA`, version, width, height, frame count,
+loop count), then each frame as a 2 byte delay in milliseconds followed by
+its packed pixels. All numbers are big-endian.
+
+From the command line, `python animation.py logo.gif 80 8` converts an
+image to an animation file.
+"""
+import hashlib
+import os
+import struct
+import sys
+
+import frame
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:
+    Image = None
+
+MAGIC = 'LDPA'
+VERSION = 1
+# magic, version, width, height, frames, loops
+HEADER = struct.Struct('>4sBHHHH')
+DELAY = struct.Struct('>H')
+EXTENSION = '.ldpa'
+
+# Sign colours as RGB, for quantizing
+PALETTE = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (255, 160, 0)]
+# Delay for frames that don't give one (seconds)
+DEFAULT_DELAY = 0.1
+
+
+class Animation(object):
+    """`width` x `height` frames, packed, each shown for the matching number
+    of seconds in `delays`; played `loops` times (0 for forever)."""
+
+    def __init__(self, width, height, frames=(), delays=(), loops=0):
+        self.width, self.height = width, height
+        self.frames = [str(packed) for packed in frames]
+        self.delays = list(delays) or [DEFAULT_DELAY] * len(self.frames)
+        self.loops = loops
+        size = (width * height + 3) // 4
+        if any(len(packed) != size for packed in self.frames):
+            raise ValueError("Frames must be {0} packed bytes.".format(size))
+        if len(self.delays) != len(self.frames):
+            raise ValueError("Every frame needs a delay.")
+        self.key = hashlib.sha1(HEADER.pack(MAGIC, VERSION, width, height, 0, 0) +
+                                ''.join(self.frames)).hexdigest()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index):
+        """Frame `index`, unpacked."""
+        return frame.Frame.unpack(self.width, self.height, self.frames[index])
+
+    def duration(self):
+        """Seconds for one pass through the frames."""
+        return sum(self.delays)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.width, self.height,
+                                len(self.frames), self.loops))
+            for packed, delay in zip(self.frames, self.delays):
+                f.write(DELAY.pack(min(int(round(delay * 1000)), 0xffff)))
+                f.write(packed)
+
+
+def read(path):
+    """Read an animation file written by `Animation.save`."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, width, height, count, loops = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{0} isn't a version {1} animation file".format(path, VERSION))
+    size = (width * height + 3) // 4
+    frames, delays = [], []
+    offset = HEADER.size
+    for n in xrange(count):
+        delays.append(DELAY.unpack_from(data, offset)[0] / 1000.0)
+        frames.append(data[offset + DELAY.size:offset + DELAY.size + size])
+        offset += DELAY.size + size
+    return Animation(width, height, frames, delays, loops)
+
+
+def fromraw(path, width, height, delay=DEFAULT_DELAY, loops=0):
+    """Animation from a file of packed frames, one after another, each
+    shown for `delay` seconds."""
+    size = (width * height + 3) // 4
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data or len(data) % size:
+        raise ValueError("{0} isn't a whole number of {1} byte frames".format(path, size))
+    frames = [data[i:i + size] for i in xrange(0, len(data), size)]
+    return Animation(width, height, frames, [delay] * len(frames), loops)
+
+
+def quantize(image, width, height):
+    """`frame.Frame` of the PIL image `image`, centred, in the sign's
+    colours."""
+    image = image.convert('RGBA')
+    cache = {}
+    out = frame.Frame(width, height)
+    left, top = (width - image.size[0]) // 2, (height - image.size[1]) // 2
+    pixels = image.load()
+    for y in xrange(max(0, -top), min(image.size[1], height - top)):
+        for x in xrange(max(0, -left), min(image.size[0], width - left)):
+            rgba = pixels[x, y]
+            colour = cache.get(rgba)
+            if colour is None:
+                r, g, b, a = rgba
+                if a < 128:
+                    colour = 0
+                else:
+                    colour = min(range(len(PALETTE)), key=lambda c: sum(
+                        (p - q) ** 2 for p, q in zip(PALETTE[c], (r, g, b))))
+                cache[rgba] = colour
+            out[y + top][x + left] = colour
+    return out
+
+
+def fromimages(paths, width, height, delay=DEFAULT_DELAY, loops=0):
+    """Animation from an animated GIF (or any image PIL can read), or from a
+    list of image files shown `delay` seconds apiece. Needs PIL."""
+    if Image is None:
+        raise RuntimeError("Reading images needs PIL (pip install Pillow).")
+    if isinstance(paths, basestring):
+        paths = [paths]
+    frames, delays = [], []
+    for path in paths:
+        image = Image.open(path)
+        if len(paths) == 1:
+            loops = image.info.get('loop', loops)
+        for still in ImageSequence.Iterator(image):
+            frames.append(quantize(still, width, height).pack())
+            delays.append(still.info.get('duration', delay * 1000) / 1000.0 or delay)
+    return Animation(width, height, frames, delays, loops)
+
+
+def load(path, width, height, delay=DEFAULT_DELAY, cache=True):
+    """Animation from the file at `path`: an animation file, a raw file of
+    packed frames (`.raw`), or an image. Images are converted once; the
+    result is saved next to them (`path + '.ldpa'`, if `cache`) and used
+    from then on, as long as it's newer than the image."""
+    if path.endswith(EXTENSION):
+        return read(path)
+    if path.endswith('.raw'):
+        return fromraw(path, width, height, delay)
+    cached = path + EXTENSION
+    if cache and os.path.exists(cached) and \
+            os.path.getmtime(cached) >= os.path.getmtime(path):
+        anim = read(cached)
+        if (anim.width, anim.height) == (width, height):
+            return anim
+    anim = fromimages(path, width, height, delay)
+    if cache:
+        anim.save(cached)
+    return anim
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit("usage: python animation.py image width height")
+    anim = load(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+    print "{0} frames, {1:.2f}s".format(len(anim), anim.duration())
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+"""Refresh-path benchmarks, run against the simulated GPIO backend.
+
+Reports backend calls and pin writes per frame, frames per second and time
+per row for `Sign.showbuffer`, `Sign.showbufferRev` and `Sign.scrollLoop`.
+The absolute timings are those of the simulator rather than the Pi, but the write counts
+are exact and the timings are good for comparing two versions of the
+refresh path on the same machine.
+
+It also times text rendering (`raster.render_many`) with and without
+NumPy, over a batch of random messages.
+
+usage: python bench.py [frames] [width] [lanes]
+
+With `lanes` > 1 the sign is split into that many parallel data lanes (see
+`ldp.PinMap`), so e.g. `python bench.py 200 320 4` compares with the plain
+80 column run.
+"""
+import sys
+from multiprocessing import Value
+from timeit import default_timer
+
+import random
+
+import ldp
+import raster
+import sign
+
+# Spare header pins for the colour lines of extra lanes
+LANES = [(ldp.R1, ldp.G1), (16, 18), (22, 24), (19, 21), (23, 26)]
+
+sim = None
+
+
+class Result(object):
+    """Outcome of one benchmark run."""
+
+    def __init__(self, name, frames, rows, calls, writes, elapsed):
+        self.name, self.frames, self.rows = name, frames, rows
+        self.calls, self.writes, self.elapsed = calls, writes, elapsed
+
+    def perframe(self, count):
+        return float(count) / self.frames
+
+    def fps(self):
+        return self.frames / self.elapsed
+
+    def rowtime(self):
+        """Mean time per lit row, in microseconds."""
+        return self.elapsed / self.rows * 1e6
+
+    def __str__(self):
+        return "{0:<16} {1:>8} {2:>12.1f} {3:>12.1f} {4:>10.1f} {5:>12.1f}".format(
+            self.name, self.frames, self.perframe(self.calls),
+            self.perframe(self.writes), self.fps(), self.rowtime())
+
+
+def measure(name, s, run):
+    """Run `run()` once and attribute the simulator's counters to `name`."""
+    sim.reset()
+    frames = ldp.writer.frames
+    start = default_timer()
+    run()
+    elapsed = default_timer() - start
+    return Result(name, ldp.writer.frames - frames, sim.latches, sim.calls,
+                  sim.writes, elapsed)
+
+
+def bench_showbuffer(s, frames):
+    s.staticPut("Testing", s.ORANGE)
+
+    def run():
+        for i in xrange(frames):
+            s.showbuffer()
+    return measure("showbuffer", s, run)
+
+
+def bench_showbufferRev(s, frames):
+    s.staticPut("Testing", s.ORANGE)
+
+    def run():
+        for i in xrange(frames):
+            s.showbufferRev()
+    return measure("showbufferRev", s, run)
+
+
+def bench_scrollLoop(s, frames):
+    s.scrollPut("1234567890abcdefgh  ", s.GREEN)
+    s._continue = Value('b', 1)
+
+    start = ldp.writer.frames
+
+    def onlatch(row):
+        if ldp.writer.frames - start >= frames - 1:
+            s._continue.value = 0
+    sim.onlatch = onlatch
+    try:
+        return measure("scrollLoop", s, s.scrollLoop)
+    finally:
+        sim.onlatch = None
+
+
+BENCHMARKS = [bench_showbuffer, bench_showbufferRev, bench_scrollLoop]
+
+RENDERERS = [('python', raster.render_python), ('numpy', raster.render_numpy)]
+
+
+def bench_render(count=1000):
+    """Render `count` random messages with each renderer; prints messages
+    and columns per second."""
+    rand = random.Random(8008)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .,:!"
+    texts = ["".join(rand.choice(letters) for i in xrange(rand.randint(5, 60)))
+             for j in xrange(count)]
+    print "{0:<16} {1:>8} {2:>12} {3:>12}".format("renderer", "messages", "msgs/s", "cols/s")
+    for name, render in RENDERERS:
+        if name == 'numpy' and raster.numpy is None:
+            print "{0:<16} (not installed)".format(name)
+            continue
+        start = default_timer()
+        frames = render(texts, 1)
+        elapsed = default_timer() - start
+        columns = sum(f.width for f in frames)
+        print "{0:<16} {1:>8} {2:>12.0f} {3:>12.0f}".format(
+            name, count, count / elapsed, columns / elapsed)
+
+
+def main(frames=200, width=80, lanes=1):
+    global sim
+    ldp.setpinmap(ldp.PinMap(LANES[:lanes]).forwidth(width))
+    sim = ldp.simulate()
+    s = sign.Sign(width)
+    print "{0:<16} {1:>8} {2:>12} {3:>12} {4:>10} {5:>12}".format(
+        "benchmark", "frames", "calls/frame", "writes/frame", "fps", "row (us)")
+    for bench in BENCHMARKS:
+        print bench(s, frames)
+    print
+    bench_render()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
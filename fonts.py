@@ -0,0 +1,253 @@
+#!/usr/bin/python
+"""Fonts for `raster`: the built-in fontv font, and binary fonts loaded
+with mmap.
+
+Fonts are looked up by name (`get`), and any of them can be used for a
+message (`Sign.staticPut(text, font='...')`). `fontv` is always there.
+More are added by `load`-ing a font file:
+
+    >>> fonts.load('/usr/share/ldp/unifont8.ldpf')
+    <BinaryFont 'unifont8'>
+    >>> s.staticPut(u"Caf\\xe9 \\u2192", font='unifont8')
+
+Font files are made from BDF fonts with `python fonts.py font.bdf out.ldpf`.
+The format is built for lookups straight out of the mapped file: a header,
+a directory of 4352 page offsets (one per 256 code points, 0 for an empty
+page), a 256 entry table of glyph offsets for each page in use, and then the
+glyphs. Each glyph is its width in a byte, then a row of `(width + 7) / 8`
+bytes, leftmost column in the top bit, for each of the font's rows. All
+offsets are from the start of the file, as little-endian 32 bit integers.
+
+Finding a glyph is two reads from the map whatever the font's size, and
+glyphs are only decoded when they're first used, so loading a big font
+costs next to nothing until its characters are actually displayed.
+"""
+import mmap
+import os
+import struct
+import sys
+
+import fontv
+
+MAGIC = 'LDPF'
+VERSION = 1
+# magic, version, rows in each glyph, unused
+HEADER = struct.Struct('<4sBBH')
+OFFSET = struct.Struct('<I')
+# Pages of 256 code points, enough to cover Unicode
+PAGES = 0x110000 >> 8
+
+# Character shown in place of one the font doesn't have
+REPLACEMENT = ord('?')
+
+
+def _rowbits(value, width):
+    """Row of a glyph as a string of 0 and 1 bytes, from an integer whose
+    top `width` bits (of `width`) are the row's pixels, leftmost first."""
+    binary = '{0:0>{width}b}'.format(value, width=width)[:width]
+    return str(bytearray(int(digit) for digit in binary))
+
+
+class Font(object):
+    """A font: `name`, and glyphs `height` rows tall. Subclasses provide
+    `_decode`."""
+
+    def __init__(self, name, height):
+        self.name, self.height = name, height
+        self.glyphs = {}
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.name)
+
+    def __contains__(self, code):
+        return self.bits(code) is not None
+
+    def bits(self, code):
+        """Rows of the glyph for code point `code`, each a string with a
+        byte (0 or 1) per column, or None if the font hasn't got it."""
+        try:
+            return self.glyphs[code]
+        except KeyError:
+            rows = self.glyphs[code] = self._decode(code)
+            return rows
+
+    def glyph(self, code):
+        """Like `bits`, but falls back to the replacement character, and
+        then to nothing at all."""
+        rows = self.bits(code)
+        if rows is None:
+            rows = self.bits(REPLACEMENT) or [''] * self.height
+        return rows
+
+
+class FontvFont(Font):
+    """The built-in font in `fontv`: printable ASCII, 8 rows tall. The
+    rest of ASCII is there too, with no width."""
+
+    def __init__(self):
+        Font.__init__(self, 'fontv', len(fontv.array[0]) - 1)
+
+    def _decode(self, code):
+        if not 0 <= code < len(fontv.array):
+            return None
+        width = fontv.array[code][0]
+        if not width:
+            # Control characters: there, but take up no room
+            return [''] * self.height
+        return [_rowbits(value, width) for value in fontv.array[code][1:]]
+
+
+class BinaryFont(Font):
+    """Font read from a file in the format described above, mapped into
+    memory rather than read in."""
+
+    def __init__(self, path, name=None):
+        if name is None:
+            name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, height, unused = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} isn't a version {1} font file".format(path, VERSION))
+        Font.__init__(self, name, height)
+
+    def _decode(self, code):
+        if not 0 <= code < 0x110000:
+            return None
+        table = OFFSET.unpack_from(self.map, HEADER.size + (code >> 8) * OFFSET.size)[0]
+        if not table:
+            return None
+        offset = OFFSET.unpack_from(self.map, table + (code & 255) * OFFSET.size)[0]
+        if not offset:
+            return None
+        width = ord(self.map[offset])
+        rowbytes = (width + 7) // 8
+        rows = []
+        for row in xrange(self.height):
+            start = offset + 1 + row * rowbytes
+            value = 0
+            for byte in bytearray(self.map[start:start + rowbytes]):
+                value = value << 8 | byte
+            rows.append(_rowbits(value >> (rowbytes * 8 - width), width))
+        return rows
+
+
+def write(path, height, glyphs):
+    """Write a font file. `glyphs` maps code points to `(width, rows)`,
+    where each row is an integer whose low `width` bits are the pixels,
+    leftmost in the highest bit (as in `fontv.array`)."""
+    pages = {}
+    for code in glyphs:
+        pages.setdefault(code >> 8, []).append(code)
+    directory = [0] * PAGES
+    offset = HEADER.size + PAGES * OFFSET.size
+    for page in sorted(pages):
+        directory[page] = offset
+        offset += 256 * OFFSET.size
+    tables, records = [], bytearray()
+    for page in sorted(pages):
+        table = [0] * 256
+        for code in sorted(pages[page]):
+            width, rows = glyphs[code]
+            rowbytes = (width + 7) // 8
+            table[code & 255] = offset + len(records)
+            records.append(width)
+            for row in list(rows)[:height] + [0] * (height - len(rows)):
+                value = row << (rowbytes * 8 - width)
+                records.extend((value >> (8 * i)) & 255 for i in reversed(range(rowbytes)))
+        tables.append(table)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, height, 0))
+        f.write(struct.pack('<{0}I'.format(PAGES), *directory))
+        for table in tables:
+            f.write(struct.pack('<256I', *table))
+        f.write(records)
+
+
+def readbdf(path):
+    """Read a BDF font; returns `(height, glyphs)` as taken by `write`."""
+    props, glyphs = {}, {}
+    with open(path) as f:
+        lines = iter(f.read().splitlines())
+    for line in lines:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] in ('FONT_ASCENT', 'FONT_DESCENT', 'FONTBOUNDINGBOX'):
+            props[words[0]] = [int(word) for word in words[1:]]
+        elif words[0] == 'STARTCHAR':
+            char = {}
+            for line in lines:
+                words = line.split()
+                if words[0] == 'BITMAP':
+                    char['BITMAP'] = []
+                    for line in lines:
+                        if line.strip() == 'ENDCHAR':
+                            break
+                        char['BITMAP'].append(line.strip())
+                    break
+                char[words[0]] = [int(word) for word in words[1:]]
+            code = char['ENCODING'][0]
+            if code < 0:
+                continue
+            glyphs[code] = char
+    if 'FONT_ASCENT' in props:
+        ascent, descent = props['FONT_ASCENT'][0], props['FONT_DESCENT'][0]
+    else:
+        w, h, x, y = props['FONTBOUNDINGBOX']
+        ascent, descent = h + y, -y
+    height = ascent + descent
+
+    out = {}
+    for code, char in glyphs.items():
+        w, h, x, y = char.get('BBX', props.get('FONTBOUNDINGBOX'))
+        x = max(x, 0)
+        width = max(char.get('DWIDTH', [w])[0], x + w)
+        rows = [0] * height
+        top = ascent - (y + h)
+        for i, bitmap in enumerate(char['BITMAP']):
+            if 0 <= top + i < height and bitmap:
+                bits = int(bitmap, 16) >> (len(bitmap) * 4 - w)
+                rows[top + i] = bits << (width - x - w)
+        out[code] = (width, rows)
+    return height, out
+
+
+FONTS = {}
+
+
+def register(font):
+    """Make `font` available by its name."""
+    FONTS[font.name] = font
+    return font
+
+
+def load(path, name=None):
+    """Load and register the font file at `path` (named after the file
+    unless `name` is given)."""
+    return register(BinaryFont(path, name))
+
+
+def get(name=None):
+    """The font called `name` (fontv if None)."""
+    if name is None:
+        name = 'fontv'
+    try:
+        return FONTS[name]
+    except KeyError:
+        raise ValueError("No font called {0!r}; load it first".format(name))
+
+
+def names():
+    return sorted(FONTS)
+
+
+register(FontvFont())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python fonts.py font.bdf out.ldpf")
+    height, glyphs = readbdf(sys.argv[1])
+    write(sys.argv[2], height, glyphs)
+    print "{0} glyphs, {1} rows tall".format(len(glyphs), height)
@@ -0,0 +1,230 @@
+"""Compact frame buffers.
+
+A `Frame` keeps one byte per pixel (the colour value, 0-3) in a single
+`bytearray`, row after row, instead of a list of lists of ints. Indexing
+still works the old way, through lightweight row views:
+
+    >>> f = frame.Frame(80, 8)
+    >>> f[2][5] = 1
+    >>> f[2][5], len(f), len(f[0])
+    (1, 8, 80)
+
+Every change made through a `Frame` bumps its `version`, so anything
+derived from the pixels (like a compiled frame program) can tell when it's
+out of date.
+
+`pack` and `Frame.unpack` convert to and from a packed form with two bits
+per pixel (four pixels to a byte, the first in the top bits), a quarter of
+the size.
+
+A pixel's low two bits are its colour, and the bits above dim it: a pixel
+at `level` (0 for off, up to `LEVELS - 1` for full brightness) is
+`shade(colour, level)`. Plain colour values are at full brightness, so
+nothing has to change for frames that don't use levels. See `frameprog`
+for how they're displayed.
+"""
+
+# Brightness levels a pixel can have (including off)
+LEVELS = 8
+
+
+def shade(colour, level=LEVELS - 1):
+    """Pixel value for `colour` at brightness `level`."""
+    if not colour or level <= 0:
+        return 0
+    return colour | (LEVELS - 1 - min(level, LEVELS - 1)) << 2
+
+
+def level(value):
+    """Brightness level of the pixel value `value`."""
+    return max(0, LEVELS - 1 - (value >> 2)) if value & 3 else 0
+
+
+# Four pixels for each packed byte value
+UNPACKED = [str(bytearray((b >> 6, b >> 4 & 3, b >> 2 & 3, b & 3))) for b in range(256)]
+
+# Translation tables: pixel values to plain colours (dropping the level),
+# and to each level
+COLOURS = str(bytearray(value & 3 for value in range(256)))
+FADES = [str(bytearray(shade(value & 3, lvl) for value in range(256)))
+         for lvl in range(LEVELS)]
+
+
+class Row(object):
+    """View of one row of a `Frame`. Reads and writes go straight to the
+    frame's bytes."""
+
+    __slots__ = ('frame', 'start', 'width')
+
+    def __init__(self, frame, row):
+        self.frame = frame
+        self.width = frame.width
+        self.start = row * frame.width
+
+    def _index(self, col):
+        if col < 0:
+            col += self.width
+        if not 0 <= col < self.width:
+            raise IndexError("column out of range")
+        return self.start + col
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return list(self.frame.data[self.start:self.start + self.width][col])
+        return self.frame.data[self._index(col)]
+
+    def __setitem__(self, col, value):
+        self.frame.data[self._index(col)] = value
+        self.frame.version += 1
+
+    def __iter__(self):
+        return iter(self.frame.data[self.start:self.start + self.width])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Frame(object):
+    """`width` x `height` bitmap of colour values, one byte per pixel, held
+    in `data`. `data` may be given to wrap existing bytes (it's used as is
+    if it's already a bytearray)."""
+
+    def __init__(self, width, height, data=None):
+        self.width, self.height = width, height
+        size = width * height
+        if data is None:
+            data = bytearray(size)
+        elif not isinstance(data, bytearray):
+            data = bytearray(data)
+        if len(data) != size:
+            raise ValueError("expected {0} bytes of pixel data, got {1}".format(size, len(data)))
+        self.data = data
+        self.version = 0
+
+    @classmethod
+    def fromrows(cls, rows):
+        """Frame holding a copy of `rows`, a list of equal-length rows of
+        colour values (the old buffer format)."""
+        rows = list(rows)
+        width = len(rows[0]) if rows else 0
+        data = bytearray()
+        for row in rows:
+            if len(row) != width:
+                raise ValueError("rows must all be the same width")
+            data.extend(bytearray(row))
+        return cls(width, len(rows), data)
+
+    @classmethod
+    def unpack(cls, width, height, packed):
+        """Frame from `width` * `height` pixels packed two bits apiece (see
+        `pack`)."""
+        size = width * height
+        if len(packed) * 4 < size:
+            raise ValueError("expected {0} bytes of packed data, got {1}".format(
+                (size + 3) // 4, len(packed)))
+        data = bytearray(''.join([UNPACKED[b] for b in bytearray(packed)]))
+        return cls(width, height, data[:size])
+
+    def pack(self):
+        """Pixels packed two bits apiece, four to a byte, first pixel in the
+        top bits (padded with blank pixels to a whole byte)."""
+        data = self.data.translate(COLOURS) + bytearray(-len(self.data) % 4)
+        return bytearray(a << 6 | b << 4 | c << 2 | d for a, b, c, d in
+                         zip(data[0::4], data[1::4], data[2::4], data[3::4]))
+
+    def tolist(self):
+        """Pixels as a list of lists of ints."""
+        return [list(row) for row in self]
+
+    def copy(self):
+        return Frame(self.width, self.height, bytearray(self.data))
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.height
+        if not 0 <= row < self.height:
+            raise IndexError("row out of range")
+        return Row(self, row)
+
+    def __iter__(self):
+        for row in xrange(self.height):
+            yield Row(self, row)
+
+    def __eq__(self, other):
+        if isinstance(other, Frame):
+            return (self.width, self.height, self.data) == (other.width, other.height, other.data)
+        try:
+            return self.tolist() == [list(row) for row in other]
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return "Frame({0}, {1})".format(self.width, self.height)
+
+    ###### Bulk operations ######
+
+    def row(self, row):
+        """Copy of row `row`'s bytes."""
+        start = row * self.width
+        return self.data[start:start + self.width]
+
+    def column(self, col):
+        """Copy of column `col`'s bytes, top to bottom."""
+        return self.data[col::self.width]
+
+    def columns(self, start, stop):
+        """New frame holding columns `start` up to `stop`."""
+        stop = min(stop, self.width)
+        start = min(start, stop)
+        out = Frame(stop - start, self.height)
+        w = stop - start
+        for row in xrange(self.height):
+            base = row * self.width
+            out.data[row * w:(row + 1) * w] = self.data[base + start:base + stop]
+        return out
+
+    def fill(self, colour=0):
+        """Set every pixel to `colour`."""
+        self.data[:] = chr(colour) * len(self.data)
+        self.version += 1
+
+    def clear(self):
+        """Blank the whole frame."""
+        self.fill(0)
+
+    def fade(self, level):
+        """Set every lit pixel to brightness `level` (see `shade`)."""
+        self.data[:] = self.data.translate(FADES[max(0, min(level, LEVELS - 1))])
+        self.version += 1
+
+    def isblank(self):
+        """True if no pixel is lit."""
+        return self.data.count('\0') == len(self.data)
+
+    def blit(self, src, x=0, y=0):
+        """Copy the frame `src` into this one with its top left corner at
+        column `x`, row `y`, clipping whatever falls outside."""
+        left, right = max(x, 0), min(x + src.width, self.width)
+        if left >= right:
+            return
+        for row in xrange(max(y, 0), min(y + src.height, self.height)):
+            base = (row - y) * src.width - x
+            dest = row * self.width
+            self.data[dest + left:dest + right] = src.data[base + left:base + right]
+        self.version += 1
@@ -0,0 +1,172 @@
+"""Frame programs: a frame buffer compiled down to the pin writes that
+display it.
+
+Displaying a static frame means walking every pixel, looking up its colour
+lines and working out which pins actually change. None of that depends on
+anything but the buffer, so `compile` does it once and records the resulting
+backend calls, row by row. `Program.replay` then only has to issue them.
+
+    >>> program = frameprog.compile(s.buffer, s.WIDTH, s.HEIGHT)
+    >>> program.replay(ldp.writer)
+
+Each row is compiled on its own, assuming only that S is high and L low
+when it starts (the colour and address lines are written as part of calls
+that happen anyway). That makes rows independent of each other, so:
+
+* rows with nothing lit are left out of the refresh entirely; the display
+  stays off and their time goes to refreshing the lit rows more often;
+* when the buffer changes, `Program.update` recompiles just the rows that
+  differ.
+
+With a pin map of several lanes (see `ldp.PinMap`), each shift clock puts a
+column into every lane at once, so a row takes `width / lanes` shifts.
+
+Rows with pixels below full brightness (see `frame.shade`) are shown by
+bit-angle modulation: the row is split into one bit-plane per bit of the
+pixels' levels, and plane `b`, which lights the pixels whose level has bit
+`b` set, is held for `2**b / (LEVELS - 1)` of the row's slot (less the time
+spent shifting; see `scheduler.Scheduler.after`). Each plane is
+compiled just like a row, so a shaded row costs 3 shifts for 8 levels
+rather than 7, and rows at full brightness cost what they always did.
+"""
+import frame
+import gpiobackend
+import ldp
+
+# Bit-planes needed for the levels in `frame.LEVELS`
+PLANES = (frame.LEVELS - 1).bit_length()
+# Share of a row's slot each plane is held for
+WEIGHTS = [float(2 ** plane) / (frame.LEVELS - 1) for plane in range(PLANES)]
+# Translation tables from pixel values to the plain colours lit in each
+# plane, and in a row with no shading
+PLANEMASKS = [str(bytearray(value & 3 if frame.level(value) >> plane & 1 else 0
+                            for value in range(256)))
+              for plane in range(PLANES)]
+FULLMASK = str(bytearray(value & 3 if frame.level(value) == frame.LEVELS - 1 else 0
+                         for value in range(256)))
+# Pixel values that are either off or at full brightness
+UNSHADED = str(bytearray(frame.level(value) in (0, frame.LEVELS - 1)
+                         for value in range(256)))
+
+
+class Program(object):
+    """Compiled frame. `rows[i]` holds the steps that display row `i`
+    (none if the row is blank): `(calls, weight)` pairs, where `calls` are
+    the backend calls that shift in and light the row (or one of its
+    bit-planes) and `weight` is the share of the row's slot to hold it for.
+    `lit` lists the rows that aren't blank. Pins come from `pinmap`
+    (`ldp.PINMAP` if None)."""
+
+    def __init__(self, width, height, pinmap=None):
+        self.width, self.height = width, height
+        self.map = pinmap = pinmap or ldp.PINMAP
+        self.lanewidth = width // len(pinmap.lanes)
+        # Pin levels every row starts from, and the pins whose final level
+        # depends on its contents
+        self.start = {pinmap.S: 1, pinmap.L: 0}
+        self.carried = pinmap.data + pinmap.address + (pinmap.EN,)
+        self.recorder = gpiobackend.RecordingBackend()
+        self.writer = ldp.PinWriter(self.recorder, pinmap)
+        self.rows = [[] for row in range(height)]
+        self.ends = [{} for row in range(height)]
+        self.source = [None] * height
+        self.lit = []
+
+    def _step(self, row, line, weight):
+        writer = self.writer
+        # Blank the display while the row is shifted in, so the previous
+        # row isn't lit for longer than its own slot
+        writer.set(self.map.EN, 0)
+        if line.count('\0') != len(line):
+            if len(self.map.lanes) == 1:
+                for value in line:
+                    writer.colourshift(value)
+            else:
+                step = self.lanewidth
+                for col in range(step):
+                    writer.shiftcolumn(line[col::step])
+            writer.showrow(row)
+        return self.recorder.take(), weight
+
+    def _compile(self, row, line):
+        writer = self.writer
+        writer.level = dict(self.start)
+        if line.translate(UNSHADED).count('\1') == len(line):
+            self.rows[row] = [self._step(row, line.translate(FULLMASK), 1.0)]
+        else:
+            self.rows[row] = [self._step(row, line.translate(PLANEMASKS[plane]), weight)
+                              for plane, weight in enumerate(WEIGHTS)]
+        self.ends[row] = dict((pin, writer.level[pin]) for pin in self.carried)
+
+    def update(self, buffer):
+        """Bring the program in line with `buffer`, recompiling only the rows
+        that have changed since it was last compiled. Returns the number of
+        rows recompiled."""
+        changed = 0
+        for row in range(self.height):
+            line = bytearray(buffer[row])[:self.width]
+            if line == self.source[row]:
+                continue
+            changed += 1
+            self.source[row] = line
+            if all(not frame.level(value) for value in line):
+                self.rows[row], self.ends[row] = [], {}
+            else:
+                self._compile(row, line)
+        if changed:
+            self.lit = [row for row in range(self.height) if self.rows[row]]
+            self.end = dict(self.start)
+            self.end[self.map.EN] = 0
+            if self.lit:
+                self.end.update(self.ends[self.lit[-1]])
+            steps = [calls for row in self.lit for calls, weight in self.rows[row]]
+            self.calls = sum(len(calls) for calls in steps)
+            self.writes = sum(1 if single else len(pins) for calls in steps
+                              for single, pins, levels in calls)
+        return changed
+
+    def replay(self, writer, hold=None):
+        """Issue the program's calls on `writer`'s backend and leave the
+        writer's counters and pin levels as if it had made them itself.
+        `hold`, if given, is called with the step's weight after each row
+        (or bit-plane) is lit (see `scheduler.Scheduler.hold`). A frame with
+        nothing lit keeps the display off and calls `hold` once per row."""
+        for weight in self.scan(writer):
+            if hold:
+                hold(weight)
+
+    def scan(self, writer):
+        """Generator form of `replay`: yields the weight of each step once it
+        has been lit (or, with nothing lit, 1.0 once per row), so that the
+        rows of several signs can be interleaved."""
+        level, m = writer.level, self.map
+        if level.get(m.S) != 1 or level.get(m.L) != 0:
+            # Pins aren't where the program expects them (first frame, or
+            # something else drove them), so bring them into line.
+            writer.write((m.S, m.L), (1, 0))
+        if not self.lit:
+            writer.set(m.EN, 0)
+            for row in range(self.height):
+                yield 1.0
+            return
+        for pin in self.carried:
+            level.pop(pin, None)
+        output, output_many = writer.backend.output, writer.backend.output_many
+        for row in self.lit:
+            for calls, weight in self.rows[row]:
+                for single, pins, levels in calls:
+                    if single:
+                        output(pins, levels)
+                    else:
+                        output_many(pins, levels)
+                yield weight
+        level.update(self.end)
+        writer.calls += self.calls
+        writer.writes += self.writes
+
+
+def compile(buffer, width, height, pinmap=None):
+    """Compile `buffer` into a `Program` that displays it."""
+    program = Program(width, height, pinmap)
+    program.update(buffer)
+    return program
@@ -0,0 +1,261 @@
+"""Pin-level backends for the `ldp` module.
+
+`ldp` never talks to a GPIO library directly; it calls `setup` and `output`
+on whatever backend is installed with `ldp.setbackend`. On a Raspberry Pi the
+default is `RPiBackend`, which wraps `RPi.GPIO`. Everywhere else `ldp` falls
+back to `SimulatedBackend`, which counts pin writes and models the LDP-8008's
+shift register and row latch so that the refresh path can be measured and
+checked off the Pi.
+
+    >>> import ldp, gpiobackend
+    >>> sim = ldp.simulate()
+    >>> ldp.init()
+    >>> sim.writes
+    165
+
+"""
+import mmap
+import os
+import struct
+from collections import deque
+from timeit import default_timer
+
+
+class Backend(object):
+    """Interface every pin backend implements. Pin numbers are whatever the
+    backend's numbering scheme is (`ldp` uses physical BOARD numbers)."""
+
+    def setup(self, pin):
+        """Configure `pin` as an output."""
+        raise NotImplementedError
+
+    def output(self, pin, level):
+        """Drive `pin` high (truthy `level`) or low."""
+        raise NotImplementedError
+
+    def output_many(self, pins, levels):
+        """Drive each of `pins` to the matching entry of `levels`, in order.
+        Backends that can change several channels in one call override
+        this."""
+        for pin, level in zip(pins, levels):
+            self.output(pin, level)
+
+    def cleanup(self):
+        """Release whatever the backend is holding on to."""
+        pass
+
+
+class RPiBackend(Backend):
+    """Backend that drives the pins through `RPi.GPIO`. Raises `ImportError`
+    when the library isn't installed (i.e. we're not on a Pi). Multi-channel
+    writes need RPi.GPIO 0.5.8 or later."""
+
+    def __init__(self):
+        import RPi.GPIO as gpio
+        gpio.setwarnings(False)
+        gpio.setmode(gpio.BOARD)
+        self.gpio = gpio
+        # Bind directly so a pin write costs one attribute lookup.
+        self.output = self.output_many = gpio.output
+
+    def setup(self, pin):
+        self.gpio.setup(pin, self.gpio.OUT)
+
+    def output(self, pin, level):
+        self.gpio.output(pin, level)
+
+    def output_many(self, pins, levels):
+        self.gpio.output(pins, levels)
+
+    def cleanup(self):
+        self.gpio.cleanup()
+
+
+class MmapBackend(Backend):
+    """Backend that writes the BCM283x GPIO registers directly through an
+    mmap of `/dev/gpiomem`, skipping RPi.GPIO and its per-pin calls.
+
+    `output_many` turns any number of pin changes into at most two word
+    writes: one to GPCLR0 for the pins going low, then one to GPSET0 for the
+    pins going high. A shift step (R1, G1 and S) and a row latch (A-D and L)
+    therefore cost one write of each. Clearing first means the latch line
+    rises together with the new row address, never before it.
+
+    Raises `EnvironmentError` when `path` can't be opened, and ValueError
+    when it's shorter than `size` bytes. `path` can be any file of at least
+    `size` bytes; mapped over a plain file, GPSET0 and
+    GPCLR0 simply hold the last masks written, which is enough to check the
+    backend anywhere. `pinmap` translates the pin numbers `ldp` uses
+    (physical BOARD numbers) to BCM GPIO numbers.
+    """
+
+    GPFSEL0 = 0x00
+    GPSET0 = 0x1c
+    GPCLR0 = 0x28
+
+    # BOARD -> BCM for the 40-pin (and rev 2 26-pin) header
+    BOARD = {3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22,
+             16: 23, 18: 24, 19: 10, 21: 9, 22: 25, 23: 11, 24: 8, 26: 7,
+             29: 5, 31: 6, 32: 12, 33: 13, 35: 19, 36: 16, 37: 26, 38: 20,
+             40: 21}
+
+    def __init__(self, path='/dev/gpiomem', pinmap=BOARD, size=4096):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.mem = mmap.mmap(fd, size, mmap.MAP_SHARED,
+                                 mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.bits = dict((pin, 1 << bcm) for pin, bcm in pinmap.items())
+        self.pinmap = dict(pinmap)
+
+    def _word(self, offset, value=None):
+        if value is None:
+            return struct.unpack_from('<I', self.mem, offset)[0]
+        struct.pack_into('<I', self.mem, offset, value)
+
+    def setup(self, pin):
+        bcm = self.pinmap[pin]
+        offset = self.GPFSEL0 + bcm // 10 * 4
+        shift = bcm % 10 * 3
+        self._word(offset, self._word(offset) & ~(7 << shift) | 1 << shift)
+
+    def output(self, pin, level):
+        struct.pack_into('<I', self.mem, self.GPSET0 if level else self.GPCLR0,
+                         self.bits[pin])
+
+    def output_many(self, pins, levels):
+        bits = self.bits
+        high = low = 0
+        for pin, level in zip(pins, levels):
+            if level:
+                high |= bits[pin]
+            else:
+                low |= bits[pin]
+        if low:
+            struct.pack_into('<I', self.mem, self.GPCLR0, low)
+        if high:
+            struct.pack_into('<I', self.mem, self.GPSET0, high)
+
+    def cleanup(self):
+        self.mem.close()
+
+
+class SimulatedBackend(Backend):
+    """Software model of an LDP-8008 hanging off a set of pins.
+
+    Every backend call and every pin write is counted; `transitions` keeps
+    the most recent `(timestamp, pin, level)` tuples. Colours are clocked
+    into a model of the shift register on the rising edge of S and copied to
+    `latched[row]` on the rising edge of L, with the row taken from the A-D
+    address lines. Each latched row lists its pixels in the order they were
+    shifted in, so after `Sign.showbuffer` it equals the corresponding row of
+    `Sign.buffer`.
+
+    `pins` maps the LDP-8008 labels ('R1', 'G1', 'S', 'L', 'EN', 'A', 'B',
+    'C', 'D') to pin numbers; see `ldp.PINS`. For chained panels driven in
+    parallel, `lanes` lists the (R1, G1) pin pair of each chain; every lane
+    has a shift register `width` columns long, and latched rows are the
+    lanes' contents end to end. `onlatch`, if set, is called with the row
+    number after every latch.
+    """
+
+    def __init__(self, pins, width=80, height=8, history=4096, clock=default_timer,
+                 lanes=None):
+        self.pins = dict(pins)
+        self.lanes = [tuple(lane) for lane in lanes or [(pins['R1'], pins['G1'])]]
+        self.width, self.height = width, height
+        self.clock = clock
+        self.onlatch = None
+        self.levels = dict((pin, 0) for pin in self.pins.values())
+        for lane in self.lanes:
+            self.levels.update((pin, 0) for pin in lane)
+        self.transitions = deque(maxlen=history)
+        self.registers = [deque([0] * width, maxlen=width) for lane in self.lanes]
+        self.register = self.registers[0]
+        self.latched = [[0] * width * len(self.lanes) for i in xrange(height)]
+        self.reset()
+
+    def reset(self):
+        """Zero the call, write, shift and latch counters and the history."""
+        self.calls = 0
+        self.writes = 0
+        self.changes = 0
+        self.shifts = 0
+        self.latches = 0
+        self.transitions.clear()
+
+    def setup(self, pin):
+        self.levels.setdefault(pin, 0)
+
+    def colour(self, lane=0):
+        """Colour currently presented on a lane's R1/G1 (both lines are
+        active low)."""
+        r1, g1 = self.lanes[lane]
+        red = not self.levels[r1]
+        green = not self.levels[g1]
+        return (1 if red else 0) | (2 if green else 0)
+
+    def address(self):
+        """Row currently selected by the A-D lines."""
+        p, lv = self.pins, self.levels
+        return lv[p['A']] | lv[p['B']] << 1 | lv[p['C']] << 2 | lv[p['D']] << 3
+
+    def displaying(self):
+        """True while EN is high."""
+        return bool(self.levels[self.pins['EN']])
+
+    def output(self, pin, level):
+        self.calls += 1
+        self._write(pin, level)
+
+    def output_many(self, pins, levels):
+        self.calls += 1
+        for pin, level in zip(pins, levels):
+            self._write(pin, level)
+
+    def _write(self, pin, level):
+        level = 1 if level else 0
+        self.writes += 1
+        previous = self.levels.get(pin, 0)
+        if previous == level:
+            return
+        self.changes += 1
+        self.levels[pin] = level
+        self.transitions.append((self.clock(), pin, level))
+        if level:
+            if pin == self.pins['S']:
+                self.shifts += 1
+                for lane, register in enumerate(self.registers):
+                    register.append(self.colour(lane))
+            elif pin == self.pins['L']:
+                row = self.address()
+                self.latches += 1
+                if row < self.height:
+                    self.latched[row] = [value for register in self.registers
+                                         for value in register]
+                if self.onlatch:
+                    self.onlatch(row)
+
+
+class RecordingBackend(Backend):
+    """Backend that drives nothing and just remembers the calls made to it,
+    as `(single, pins, levels)` tuples in `ops`. Used to compile frames into
+    replayable programs (see `frameprog`)."""
+
+    def __init__(self):
+        self.ops = []
+
+    def setup(self, pin):
+        pass
+
+    def output(self, pin, level):
+        self.ops.append((True, pin, level))
+
+    def output_many(self, pins, levels):
+        self.ops.append((False, tuple(pins), tuple(levels)))
+
+    def take(self):
+        """Return the calls recorded so far and start a new list."""
+        ops, self.ops = self.ops, []
+        return ops
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+"""Binary frame ingest: other processes push whole frames to the sign.
+
+A `FrameServer` listens for datagrams on a Unix socket and/or a UDP port.
+Each one is a frame packed two bits per pixel, four pixels to a byte, first
+pixel in the top bits (see `frame.Frame.pack`). For an 80x8 sign that's 160
+bytes; in general it's `WIDTH * HEIGHT / 4`. A frame may be prefixed with a
+4 byte big-endian sequence number, and then frames that arrive out of order
+are dropped as late. A sequence number of 0 restarts the sequence.
+
+Frames go straight into the display process's back buffer and are flipped
+in, without ever becoming pixel objects. If frames arrive faster than the
+display picks them up, only the newest is kept; the ones it replaces are
+counted as superseded.
+
+    >>> server = ingest.FrameServer(s, path='/tmp/ldp.sock', port=8008)
+    >>> server.start()
+    >>> server.stats['displayed']
+    0
+
+From the command line: `python ingest.py [port] [socket path]`.
+"""
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+import frame
+import worker
+
+# How long to wait for a frame before checking whether to stop (seconds)
+POLL = 0.1
+# How often to retry showing a frame the display hasn't made room for yet
+RETRY = 0.0005
+
+
+class FrameServer(object):
+    """Receives packed frames for `sign` on the Unix datagram socket `path`
+    and/or UDP port `port` (on `host`, all interfaces by default).
+
+    `stats` counts frames received, displayed, dropped as late or
+    superseded, and datagrams rejected for being the wrong size. The sign's
+    metrics count them too.
+    """
+
+    def __init__(self, sign, path=None, port=None, host=''):
+        self.sign = sign
+        self.size = (sign.WIDTH * sign.HEIGHT + 3) // 4
+        self.path = path
+        self.sockets = []
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)  # left over from an earlier server
+            self.sockets.append(self._bind(socket.AF_UNIX, path))
+        if port is not None:
+            self.sockets.append(self._bind(socket.AF_INET, (host, port)))
+        self.stats = dict(received=0, displayed=0, late=0, superseded=0, rejected=0)
+        self.sequence = None
+        self.pending = None
+        self.thread = None
+        self.running = False
+
+    def _bind(self, family, address):
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.bind(address)
+        sock.setblocking(0)
+        return sock
+
+    def start(self):
+        """Serve in a background thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving and close the sockets."""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def run(self):
+        while self.running:
+            readable = select.select(self.sockets, [], [],
+                                     RETRY if self.pending else POLL)[0]
+            for sock in readable:
+                while True:
+                    try:
+                        data = sock.recv(self.size + 5)
+                    except socket.error as e:
+                        if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                            break
+                        raise
+                    self.receive(data)
+            if self.pending is not None:
+                self.display()
+
+    def _count(self, name, metric):
+        self.stats[name] += 1
+        if metric:
+            self.sign.metrics.inc(metric)
+
+    def receive(self, data):
+        """Take in one datagram."""
+        if len(data) == self.size + 4:
+            sequence = struct.unpack('>I', data[:4])[0]
+            data = data[4:]
+            if sequence and self.sequence is not None and \
+                    0 <= (self.sequence - sequence) % 2**32 < 2**31:
+                self._count('received', 'ingest_frames')
+                self._count('late', 'ingest_dropped')
+                return
+            self.sequence = sequence
+        elif len(data) != self.size:
+            self._count('rejected', 'ingest_rejected')
+            return
+        self._count('received', 'ingest_frames')
+        if self.pending is not None:
+            self._count('superseded', 'ingest_dropped')
+        self.pending = data
+
+    def display(self):
+        """Flip the pending frame in, if the display process has picked up
+        the last one."""
+        sign, channel = self.sign, self.sign.channel
+        if sign.worker.running() and channel.seen.value != channel.generation.value:
+            return
+        size = sign.WIDTH * sign.HEIGHT
+        data = ''.join([frame.UNPACKED[b] for b in bytearray(self.pending)])[:size]
+        self.pending = None
+        sign.worker.start()
+        channel.flip(data)
+        if channel.metrics.get('mode') != worker.STATIC:
+            channel.command('static')
+        sign.displayProcess = sign.worker.process
+        self._count('displayed', None)
+
+
+def main(port=8008, path=None):
+    import sign
+    s = sign.Sign()
+    server = FrameServer(s, path, port)
+    server.start()
+    try:
+        while True:
+            time.sleep(10)
+            print server.stats
+    except KeyboardInterrupt:
+        server.stop()
+        s.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 8008, args[1] if args[1:] else None)
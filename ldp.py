@@ -20,9 +20,7 @@
 #     15  ------------> 16  S (Shift)
 ###################################################
 
-import RPi.GPIO as gpio
-gpio.setwarnings(False)
-gpio.setmode(gpio.BOARD)
+import gpiobackend
 
 ###################################################
 # give the gpio pins labels that match the LDP-8008
@@ -37,6 +35,287 @@ D=10
 L=13  
 S=15  
 
+PINS = {'R1': R1, 'G1': G1, 'EN': EN, 'A': A, 'B': B,
+	'C': C, 'D': D, 'L': L, 'S': S}
+
+###################################################
+# pick the pin backend: RPi.GPIO on a Pi, otherwise
+# a simulated sign (see gpiobackend.py)
+###################################################
+try:
+	backend = gpiobackend.RPiBackend()
+except ImportError:
+	backend = gpiobackend.SimulatedBackend(PINS)
+
+####################################
+# pin level tables
+# R1/G1 levels for each colour value 
+# (the colour lines are active low) 
+# and A/B/C/D levels for each row
+####################################
+COLOURS = {
+	0: (1, 1), # off
+	1: (0, 1), # red
+	2: (1, 0), # green
+	3: (0, 0), # orange
+}
+ROWS = [(n & 1, n >> 1 & 1, n >> 2 & 1, n >> 3 & 1) for n in range(16)]
+
+####################################
+# PinMap class
+# usage: m = ldp.PinMap(lanes=((11, 12), (16, 18)))
+# which pins drive the sign. Panels 
+# can be chained end to end on one 
+# pair of colour lines, or split into 
+# groups ("lanes"), each with its own 
+# R1/G1 pair; all lanes share S, L, 
+# EN and A-D, so one shift clock 
+# pushes a column into every lane at 
+# once. `width` is the number of 
+# columns in each lane; lane 0 shows 
+# the leftmost `width` columns of the 
+# sign, lane 1 the next, and so on
+####################################
+class PinMap(object):
+	def __init__(self, lanes=((R1, G1),), s=S, l=L, en=EN,
+			address=(A, B, C, D), width=80):
+		self.lanes = tuple(tuple(lane) for lane in lanes)
+		self.S, self.L, self.EN = s, l, en
+		self.address = tuple(address)
+		self.width = width
+		# colour lines of every lane, R1 
+		# before G1, in lane order
+		self.data = tuple(pin for lane in self.lanes for pin in lane)
+
+	# the same pins for a sign `width` 
+	# columns wide in total
+	def forwidth(self, width):
+		if width % len(self.lanes):
+			raise ValueError("Sign width {0} doesn't divide into {1} lanes".format(
+				width, len(self.lanes)))
+		return PinMap(self.lanes, self.S, self.L, self.EN, self.address,
+			width // len(self.lanes))
+
+	# every pin used, for setting up
+	def pins(self):
+		return self.data + (self.EN, self.L, self.S) + self.address
+
+	# LDP-8008 labels for the simulator 
+	# (R1/G1 are those of lane 0)
+	def simpins(self):
+		a, b, c, d = self.address
+		return {'R1': self.lanes[0][0], 'G1': self.lanes[0][1], 'EN': self.EN,
+			'A': a, 'B': b, 'C': c, 'D': d, 'L': self.L, 'S': self.S}
+####################################
+# end PinMap class
+####################################
+
+PINMAP = PinMap()
+
+####################################
+# PinWriter class
+# usage: w = ldp.PinWriter(backend)
+# remembers the last level written 
+# to each pin, drops writes that 
+# would not change anything and 
+# sends the rest to the backend as 
+# one multi-channel call. pins come 
+# from `pinmap` (ldp.PINMAP if None)
+####################################
+class PinWriter(object):
+	def __init__(self, backend, pinmap=None):
+		self.backend = backend
+		self.map = pinmap = pinmap or PINMAP
+		self.level = {}
+		self.calls = 0   # backend calls made
+		self.writes = 0  # pin writes made
+		self.skipped = 0 # pin writes dropped as no-ops
+		self.frames = 0
+		self.lastframe = (0, 0) # (calls, writes) of the last frame
+		self._mark = (0, 0)
+		# a column is shifted in by writing 
+		# the colour lines of every lane 
+		# together with S going low
+		self.shiftpins = pinmap.data + (pinmap.S,)
+		lanes = len(pinmap.lanes)
+		# (indexed by pixel value; only the
+		# low two bits are the colour)
+		self.shiftlevels = [COLOURS[n & 3] * lanes + (0,) for n in range(256)]
+
+	# forget the pin levels, e.g. after
+	# something else has driven the pins
+	def invalidate(self):
+		self.level = {}
+
+	# drive a single pin
+	def set(self, pin, value):
+		if self.level.get(pin) == value:
+			self.skipped += 1
+			return
+		self.level[pin] = value
+		self.calls += 1
+		self.writes += 1
+		self.backend.output(pin, value)
+
+	# drive several pins at once; they 
+	# change in the order given
+	def write(self, pins, values):
+		level = self.level
+		changed = [i for i in range(len(pins)) if level.get(pins[i]) != values[i]]
+		self.skipped += len(pins) - len(changed)
+		if not changed:
+			return
+		self.calls += 1
+		self.writes += len(changed)
+		if len(changed) == 1:
+			i = changed[0]
+			level[pins[i]] = values[i]
+			self.backend.output(pins[i], values[i])
+		else:
+			pins = [pins[i] for i in changed]
+			values = [values[i] for i in changed]
+			level.update(zip(pins, values))
+			self.backend.output_many(pins, values)
+
+	# close off a frame and record its 
+	# call and write counts in lastframe
+	def endframe(self):
+		calls, writes = self._mark
+		self.lastframe = (self.calls - calls, self.writes - writes)
+		self._mark = (self.calls, self.writes)
+		self.frames += 1
+
+	# the LDP-8008 operations behind the 
+	# module functions of the same names
+	# (colours go to every lane)
+	def shift(self):
+		S = self.map.S
+		self.set(S,1)
+		self.set(S,0)
+		self.set(S,1)
+
+	def colour(self, n):
+		self.write(self.map.data, COLOURS.get(n, COLOURS[0]) * len(self.map.lanes))
+
+	# S is pulled low in the same call as 
+	# the colour lines, so a pixel costs 
+	# at most two backend calls
+	def colourshift(self, n):
+		S = self.map.S
+		self.set(S,1)
+		self.write(self.shiftpins, self.shiftlevels[n & 255])
+		self.set(S,1)
+
+	# shift in one column: colours[i] 
+	# goes into lane i
+	def shiftcolumn(self, colours):
+		S = self.map.S
+		levels = []
+		for n in colours:
+			levels.extend(COLOURS[n & 3])
+		levels.append(0)
+		self.set(S,1)
+		self.write(self.shiftpins, levels)
+		self.set(S,1)
+
+	# the address lines are set and the 
+	# latch raised in a single call
+	def showrow(self, n):
+		m = self.map
+		self.write(m.address + (m.L,), ROWS[n if 0 <= n < 8 else 0] + (1,))
+		self.set(m.L,0)
+		self.set(m.EN,1)
+
+	def init(self):
+		# set the pins up as outputs
+		m = self.map
+		for pin in m.pins():
+			self.backend.setup(pin)
+
+		#initialise the output pins (their 
+		#levels are unknown until we do)
+		self.invalidate()
+		self.write(m.data + (m.S, m.L, m.EN), (1,) * len(m.data) + (1, 0, 0))
+		self.clear()
+
+	def clear(self):
+		self.colour(0)
+		for i in range(self.map.width):
+			self.shift()
+		self.set(self.map.EN,0)
+####################################
+# end PinWriter class
+####################################
+
+writer = PinWriter(backend)
+
+####################################
+# setbackend function
+# usage: ldp.setbackend(backend)
+# routes all pin writes through 
+# `backend` (see gpiobackend.py)
+####################################
+def setbackend(b):
+	global backend, writer
+	backend = b
+	writer = PinWriter(b)
+####################################
+# end setbackend function
+####################################
+
+####################################
+# setpinmap function
+# usage: ldp.setpinmap(ldp.PinMap(...))
+# drives the sign through the pins in 
+# `pinmap` from now on. call it before 
+# ldp.simulate() so the simulated 
+# sign gets the same lanes
+####################################
+def setpinmap(pinmap):
+	global PINMAP, writer
+	PINMAP = pinmap
+	writer = PinWriter(backend, pinmap)
+####################################
+# end setpinmap function
+####################################
+
+####################################
+# usemmap function
+# usage: ok = ldp.usemmap()
+# switches to the memory-mapped GPIO 
+# register backend if `path` can be 
+# mapped (and big enough); otherwise 
+# leaves the current backend alone and 
+# returns False
+####################################
+def usemmap(path='/dev/gpiomem'):
+	try:
+		setbackend(gpiobackend.MmapBackend(path))
+	except (EnvironmentError, ValueError):
+		# ValueError: a file too short to map
+		return False
+	return True
+####################################
+# end usemmap function
+####################################
+
+####################################
+# simulate function
+# usage: sim = ldp.simulate()
+# installs and returns a fresh 
+# simulated backend for testing 
+# and benchmarking off the Pi
+####################################
+def simulate(**kwargs):
+	kwargs.setdefault('width', PINMAP.width)
+	kwargs.setdefault('lanes', PINMAP.lanes)
+	sim = gpiobackend.SimulatedBackend(PINMAP.simpins(), **kwargs)
+	setbackend(sim)
+	return sim
+####################################
+# end simulate function
+####################################
+
 ####################################
 # init function
 # usage: ldp.init()
@@ -45,24 +324,7 @@ S=15
 ####################################
 
 def init():
-	# set GPIO pins as outputs
-	gpio.setup(R1,gpio.OUT)
-	gpio.setup(G1,gpio.OUT)
-	gpio.setup(EN,gpio.OUT)
-	gpio.setup(A,gpio.OUT)
-	gpio.setup(B,gpio.OUT)
-	gpio.setup(C,gpio.OUT)
-	gpio.setup(D,gpio.OUT)
-	gpio.setup(L,gpio.OUT)
-	gpio.setup(S,gpio.OUT)
-
-	#initialise the output pins
-	gpio.output(R1,1)
-	gpio.output(G1,1)
-	gpio.output(S,1)
-	gpio.output(L,0)
-	gpio.output(EN,0)
-	clear()
+	writer.init()
 ####################################
 # end init function
 ####################################
@@ -75,13 +337,7 @@ def init():
 # bits to blank and turns off display
 ####################################
 def clear():
-		gpio.output(R1,1)
-		gpio.output(G1,1)
-		for i in range(80):
-			gpio.output(S,1)
-			gpio.output(S,0)
-			gpio.output(S,1)
-		displayoff()
+		writer.clear()
 ####################################
 # end init function
 ####################################
@@ -92,11 +348,11 @@ def clear():
 # usage: ldp.shift()
 # function shifts the current led colour 
 # into the first column of the register
+# (S idles high; the data is clocked 
+# in on its rising edge)
 ####################################
 def shift():
-		gpio.output(S,1)
-		gpio.output(S,0)
-		gpio.output(S,1)
+		writer.shift()
 ####################################
 # end shift function
 ####################################
@@ -108,18 +364,7 @@ def shift():
 # 0=blank 1=red 2=green 3=orange
 ####################################
 def colour(n):
-	if n == 3: #orange	
-		gpio.output(R1,0)
-		gpio.output(G1,0)
-	elif n == 2: #green
-		gpio.output(R1,1)
-		gpio.output(G1,0)
-	elif n == 1: #red
-		gpio.output(R1,0)
-		gpio.output(G1,1)
-	else: # off
-		gpio.output(R1,1)
-		gpio.output(G1,1)
+	writer.colour(n)
 ####################################
 # end colour function
 ####################################
@@ -132,21 +377,7 @@ def colour(n):
 # 0=blank 1=red 2=green 3=orange
 ####################################
 def colourshift(n):
-	if n == 3: #orange	
-		gpio.output(R1,0)
-		gpio.output(G1,0)
-	elif n == 2: #green
-		gpio.output(R1,1)
-		gpio.output(G1,0)
-	elif n == 1: #red
-		gpio.output(R1,0)
-		gpio.output(G1,1)
-	else: # off
-		gpio.output(R1,1)
-		gpio.output(G1,1)
-	gpio.output(S,1)
-	gpio.output(S,0)
-	gpio.output(S,1)
+	writer.colourshift(n)
 ####################################
 # end colour function
 ####################################
@@ -158,62 +389,42 @@ def colourshift(n):
 # row_value = 0-7
 ####################################
 def showrow(n):
-	if n == 7:
-		gpio.output(A,1)
-		gpio.output(B,1)
-		gpio.output(C,1)
-		gpio.output(D,0)
-	elif n == 6:
-		gpio.output(A,0)
-		gpio.output(B,1)
-		gpio.output(C,1)
-		gpio.output(D,0)
-	elif n == 5:
-		gpio.output(A,1)
-		gpio.output(B,0)
-		gpio.output(C,1)
-		gpio.output(D,0)
-	elif n == 4:
-		gpio.output(A,0)
-		gpio.output(B,0)
-		gpio.output(C,1)
-		gpio.output(D,0)
-	elif n == 3:
-		gpio.output(A,1)
-		gpio.output(B,1)
-		gpio.output(C,0)
-		gpio.output(D,0)
-	elif n == 2:
-		gpio.output(A,0)
-		gpio.output(B,2)
-		gpio.output(C,0)
-		gpio.output(D,0)
-	elif n == 1:
-		gpio.output(A,1)
-		gpio.output(B,0)
-		gpio.output(C,0)
-		gpio.output(D,0)
-	else:
-		gpio.output(A,0)
-		gpio.output(B,0)
-		gpio.output(C,0)
-		gpio.output(D,0)
-	# latch the data
-	gpio.output(L,1)
-	gpio.output(L,0)
-	# display the row
-	gpio.output(EN,1)
+	writer.showrow(n)
 ####################################
 # end showrow function
 ####################################
 
+####################################
+# endframe function
+# usage: ldp.endframe()
+# marks the end of a frame so that 
+# ldp.framestats() covers it
+####################################
+def endframe():
+	writer.endframe()
+####################################
+# end endframe function
+####################################
+
+####################################
+# framestats function
+# usage: calls, writes = ldp.framestats()
+# backend calls and pin writes made 
+# during the last complete frame
+####################################
+def framestats():
+	return writer.lastframe
+####################################
+# end framestats function
+####################################
+
 ####################################
 # displayoff function
 # usage: ldp.displayoff()
 # turns off the display 
 ####################################
 def displayoff():
-	gpio.output(EN,0)
+	writer.set(writer.map.EN,0)
 ####################################
 # end displayoff function
 ####################################
@@ -224,7 +435,7 @@ def displayoff():
 # turns on the display 
 ####################################
 def displayon():
-	gpio.output(EN,1)
+	writer.set(writer.map.EN,1)
 ####################################
 # end displayon function
 ####################################
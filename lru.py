@@ -0,0 +1,78 @@
+"""Small least-recently-used cache, with hit and miss counters."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Mapping that holds at most `maxsize` entries, dropping the least
+    recently used one to make room.
+
+    If `sizeof` is given, it measures each value in bytes, and with
+    `maxbytes` the entries are kept to that budget too; `bytes` is the current total. A value
+    bigger than the whole budget isn't cached at all. `maxbytes` can be
+    changed at any time, and takes effect on the next `put`. It's safe to
+    use from several threads.
+
+    >>> cache = lru.LRUCache(2)
+    >>> cache.put('a', 1)
+    >>> cache.get('a'), cache.get('b')
+    (1, None)
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes, self.sizeof = maxbytes, sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value for `key` (marking it recently used), or
+        `default` if it isn't cached."""
+        with self.lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache `value` under `key`, evicting the oldest entries if the
+        cache is full."""
+        size = self.sizeof(value) if self.sizeof else 0
+        with self.lock:
+            self._discard(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+            while len(self._data) > self.maxsize or \
+                    (self.maxbytes is not None and self.bytes > self.maxbytes):
+                self._discard(next(iter(self._data)))
+                self.evictions += 1
+
+    def _discard(self, key):
+        if key in self._data:
+            del self._data[key]
+            self.bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self.lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
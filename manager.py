@@ -0,0 +1,82 @@
+"""Several signs on one Pi, refreshed by a single display process.
+
+Each `Sign` normally gets a display process of its own, and two or three of
+them refreshing flat out fight over the CPU and flicker. A `SignManager`
+owns a set of signs, each on its own pins, and one `worker.RefreshWorker`
+that interleaves their row scans: every row slot, each sign that's showing
+something lights its next row. Each sign keeps its own message and
+static/scroll state and is updated through the usual `Sign` methods.
+
+    >>> signs = manager.SignManager()
+    >>> door = signs.add('door', ldp.PinMap(lanes=[(11, 12)]))
+    >>> hall = signs.add('hall', ldp.PinMap(lanes=[(16, 18)], s=22, l=24,
+    ...                                     en=26, address=(19, 21, 23, 29)))
+    >>> door.staticPut("Welcome")
+    >>> door.static()
+    >>> signs['hall'].scrollPut("Meeting at 3 in room 2  ")
+    >>> signs['hall'].scroll()
+
+"""
+from collections import OrderedDict
+
+import metrics
+import worker
+from sign import Sign
+
+
+class SignManager(object):
+    """Signs sharing one display process, refreshed `refresh` times a
+    second. `metrics` covers the process as a whole (missed deadlines, row
+    jitter, time blank, the profiler); each sign's own `metrics` has its
+    frame counts. `realtime` (a `realtime.Realtime`) is applied to the
+    display process.
+
+    No two signs may share a pin, and all of them must be added before
+    anything is displayed.
+    """
+
+    def __init__(self, refresh=100.0, realtime=None):
+        self.metrics = metrics.Metrics()
+        self.worker = worker.RefreshWorker(refresh, self.metrics, realtime)
+        self.signs = OrderedDict()
+
+    def add(self, name, pinmap, width=80, height=8, scrollspeed=20.0, backend=None):
+        """Add a sign driven through the pins in `pinmap` (an `ldp.PinMap`)
+        and return it."""
+        if name in self.signs:
+            raise ValueError("There's already a sign called {0!r}.".format(name))
+        used = set(pinmap.pins())
+        for other in self.signs.values():
+            if used.intersection(other.writer.map.pins()):
+                raise ValueError("Sign {0!r} shares pins with another sign.".format(name))
+        sign = Sign(width, height, scrollspeed=scrollspeed, pinmap=pinmap,
+                    worker=self.worker, backend=backend)
+        self.signs[name] = sign
+        return sign
+
+    def __getitem__(self, name):
+        return self.signs[name]
+
+    def __contains__(self, name):
+        return name in self.signs
+
+    def __iter__(self):
+        return iter(self.signs)
+
+    def __len__(self):
+        return len(self.signs)
+
+    def items(self):
+        return self.signs.items()
+
+    def start(self):
+        """Start the display process (done anyway when a sign first displays
+        something)."""
+        self.worker.start()
+
+    def shutdown(self):
+        """Blank all the signs and end the display process."""
+        self.worker.shutdown()
+        for sign in self.signs.values():
+            sign.displayProcess = False
+            sign.currentMessage = ""
@@ -0,0 +1,202 @@
+"""Counters and histograms shared between a sign and its display process.
+
+All values live in one shared `RawArray` of doubles, so the refresh loop
+updates them with plain stores (no locks, no messages) and the `Sign` in the
+parent process, or the web app, reads them whenever it likes. Each value has
+a single writer: the display process for everything about refreshing, the
+parent for render times.
+
+    >>> m = metrics.Metrics()
+    >>> m.inc('frames')
+    >>> m.observe('render_seconds', 0.002)
+    >>> m.get('frames')
+    1.0
+    >>> print m.prometheus()          # doctest: +SKIP
+
+`Sampler` is a small opt-in statistical profiler for the refresh loop; see
+`Sign.profile`.
+"""
+import bisect
+import os
+import signal
+import tempfile
+from collections import defaultdict
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+# name: help text
+COUNTERS = [
+    ('frames', "Frames displayed."),
+    ('rows', "Rows displayed."),
+    ('pin_calls', "Backend calls made by the refresh loop."),
+    ('pin_writes', "Pin writes made by the refresh loop."),
+    ('missed_deadlines', "Rows not ready before their time slot ended."),
+    ('stalls', "Row slots that ended late enough to show as a flicker."),
+    ('blank_seconds', "Time the display process spent with the sign blank."),
+    ('flips', "Frames flipped in by producers."),
+    ('commands', "Commands handled by the display process."),
+    ('scroll_cache_hits', "scrollPut calls that reused a prepared scroll."),
+    ('scroll_cache_misses', "scrollPut calls that had to prepare a scroll."),
+    ('animation_compiles', "Animation frames compiled by the display process."),
+    ('ingest_frames', "Frames received by the frame ingest server."),
+    ('ingest_dropped', "Ingested frames dropped as late or superseded."),
+    ('ingest_rejected', "Datagrams the frame ingest server rejected as the wrong size."),
+]
+
+GAUGES = [
+    ('fps', "Frames per second over the last second."),
+    ('mode', "Display mode (0 blank, 1 static, 2 scroll, 3 animation)."),
+    ('realtime_cpu', "CPU the display process is pinned to (-1 if none)."),
+    ('realtime_fifo', "1 if the display process runs under SCHED_FIFO."),
+    ('realtime_locked', "1 if the display process's memory is locked."),
+]
+
+# name: (help text, bucket upper bounds)
+HISTOGRAMS = [
+    ('frame_seconds', "Time taken by each frame.",
+     (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)),
+    ('row_jitter_seconds', "How far past its deadline each row slot ended.",
+     (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01)),
+    ('render_seconds', "Time taken to render text with drawText.",
+     (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)),
+]
+
+# Figures the refresh loop keeps for the display process as a whole (see
+# `worker.RefreshWorker`); signs sharing a process share these
+PROCESS = ('missed_deadlines', 'stalls', 'blank_seconds', 'row_jitter_seconds',
+           'realtime_cpu', 'realtime_fifo', 'realtime_locked')
+
+
+def _labels(labels, extra=()):
+    """Prometheus label set for the dict `labels` plus the pairs `extra`."""
+    pairs = sorted(labels.items()) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+    return '{' + ','.join('{0}="{1}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+
+def prometheus(series, prefix='ldp_'):
+    """Prometheus text exposition of several sets of values, each a
+    `(labels, snapshot)` pair: a dict of labels to tell it apart, and
+    values as given by `Metrics.snapshot`."""
+    lines = []
+    for name, doc in COUNTERS:
+        full = prefix + name + '_total'
+        lines += ['# HELP {0} {1}'.format(full, doc),
+                  '# TYPE {0} counter'.format(full)]
+        lines += ['{0}{1} {2!r}'.format(full, _labels(labels), values[name])
+                  for labels, values in series]
+    for name, doc in GAUGES:
+        full = prefix + name
+        lines += ['# HELP {0} {1}'.format(full, doc),
+                  '# TYPE {0} gauge'.format(full)]
+        lines += ['{0}{1} {2!r}'.format(full, _labels(labels), values[name])
+                  for labels, values in series]
+    for name, doc, bounds in HISTOGRAMS:
+        full = prefix + name
+        lines += ['# HELP {0} {1}'.format(full, doc),
+                  '# TYPE {0} histogram'.format(full)]
+        for labels, values in series:
+            buckets, total, count = values[name]
+            for bound, cumulative in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_bucket{1} {2!r}'.format(
+                    full, _labels(labels, [('le', le)]), cumulative))
+            lines += ['{0}_sum{1} {2!r}'.format(full, _labels(labels), total),
+                      '{0}_count{1} {2!r}'.format(full, _labels(labels), count)]
+    return '\n'.join(lines) + '\n'
+
+
+class Metrics(object):
+    """Shared set of the counters, gauges and histograms listed above."""
+
+    PREFIX = 'ldp_'
+
+    def __init__(self):
+        self.index = {}
+        self.bounds = {}
+        size = 0
+        for name, doc in COUNTERS + GAUGES:
+            self.index[name] = size
+            size += 1
+        for name, doc, bounds in HISTOGRAMS:
+            # One slot per bucket (plus +Inf), then the sum and the count
+            self.index[name] = size
+            self.bounds[name] = bounds
+            size += len(bounds) + 3
+        self.values = RawArray('d', size)
+        self.profiling = RawValue('b', 0)
+        self.profilePath = os.path.join(tempfile.gettempdir(), 'ldp-profile.txt')
+
+    def inc(self, name, amount=1):
+        self.values[self.index[name]] += amount
+
+    def set(self, name, value):
+        self.values[self.index[name]] = value
+
+    def get(self, name):
+        return self.values[self.index[name]]
+
+    def observe(self, name, value):
+        """Add `value` to the histogram `name`."""
+        bounds = self.bounds[name]
+        base = self.index[name]
+        values = self.values
+        values[base + bisect.bisect_left(bounds, value)] += 1
+        values[base + len(bounds) + 1] += value
+        values[base + len(bounds) + 2] += 1
+
+    def histogram(self, name):
+        """`(buckets, sum, count)` for the histogram `name`, where `buckets`
+        lists `(upper bound, cumulative count)` pairs ending with +Inf."""
+        bounds = self.bounds[name]
+        base = self.index[name]
+        total, buckets = 0, []
+        for i, bound in enumerate(bounds + (float('inf'),)):
+            total += self.values[base + i]
+            buckets.append((bound, total))
+        return buckets, self.values[base + len(bounds) + 1], self.values[base + len(bounds) + 2]
+
+    def snapshot(self):
+        """All values as a dict; histograms appear as `(buckets, sum, count)`."""
+        out = dict((name, self.get(name)) for name, doc in COUNTERS + GAUGES)
+        for name, doc, bounds in HISTOGRAMS:
+            out[name] = self.histogram(name)
+        return out
+
+    def prometheus(self, labels=None):
+        """Everything in the Prometheus text exposition format, with
+        `labels` (a dict) on every sample."""
+        return prometheus([(labels or {}, self.snapshot())], self.PREFIX)
+
+
+class Sampler(object):
+    """Statistical profiler: every `interval` seconds of CPU time, notes
+    which function the process is in. Only one can run per process, since it
+    uses the ITIMER_PROF timer."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = defaultdict(int)
+
+    def _sample(self, signum, frame):
+        code = frame.f_code
+        self.samples['{0}:{1} ({2})'.format(
+            os.path.basename(code.co_filename), frame.f_lineno, code.co_name)] += 1
+
+    def start(self):
+        self.samples.clear()
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def report(self, limit=40):
+        """The most sampled locations, one per line."""
+        total = sum(self.samples.values()) or 1
+        top = sorted(self.samples.items(), key=lambda item: -item[1])[:limit]
+        return '\n'.join('{0:6.1f}% {1:7d}  {2}'.format(100.0 * count / total, count, where)
+                         for where, count in top) + '\n'
@@ -0,0 +1,279 @@
+"""Playlists: a rotation of timed messages, shown one after another.
+
+A `Playlist` is a list of `Item`s, each a static message, a scrolling one,
+or a sequence of frames, and each shown for a `duration` in seconds or for
+a number of `repeat`s (passes of a scroll, loops of the frames). A `Player`
+plays a playlist on a sign from a background thread, going round again if
+the playlist `loop`s.
+
+    >>> p = playlist.Playlist('lobby', [
+    ...     playlist.Item('static', text="Welcome", duration=10),
+    ...     playlist.Item('scroll', text="Talks today in room 2  ", repeat=2),
+    ... ])
+    >>> player = playlist.Player(s, p)
+    >>> player.start()
+
+Rendering a message takes long enough to show as a glitch if it happens at
+the moment of switching, so while one item is showing, a second thread
+prepares the next one (its frame, or its scroll, via the sign's caches).
+The switch itself is just a flip. At the start, every message in the
+playlist is rendered in one batch (see `Sign.prerender`).
+
+Playlists convert to and from plain dicts (`todict`, `fromdict`) for
+storing and for the web app. Frames are given packed (see
+`frame.Frame.pack`), base64 encoded.
+"""
+import base64
+import threading
+import time
+
+import frame
+import scroller
+
+STATIC = 'static'
+SCROLL = 'scroll'
+FRAMES = 'frames'
+KINDS = (STATIC, SCROLL, FRAMES)
+
+# Seconds shown for items given neither a duration nor a repeat count
+DEFAULT_DURATION = 10.0
+
+
+class Item(object):
+    """One entry in a playlist: `kind` is 'static' or 'scroll' (showing
+    `text` in `color` and `font`), or 'frames' (showing each of `frames`, a
+    list of `frame.Frame`s, for `interval` seconds). It's shown for
+    `duration` seconds or `repeat` times over."""
+
+    def __init__(self, kind, text=None, color=1, font=None, frames=None, interval=0.1,
+                 direction=scroller.FORWARD, duration=None, repeat=None):
+        if kind not in KINDS:
+            raise ValueError("Unknown item kind {0!r}.".format(kind))
+        if kind == FRAMES and not frames:
+            raise ValueError("A frames item needs some frames.")
+        if kind != FRAMES and text is None:
+            raise ValueError("A {0} item needs some text.".format(kind))
+        self.kind = kind
+        self.text, self.color, self.font = text, color, font
+        self.frames, self.interval = frames, interval
+        self.direction = direction
+        self.duration, self.repeat = duration, repeat
+
+    def todict(self):
+        out = dict(kind=self.kind, duration=self.duration, repeat=self.repeat)
+        if self.kind == FRAMES:
+            out.update(width=self.frames[0].width, height=self.frames[0].height,
+                       interval=self.interval,
+                       frames=[base64.b64encode(str(f.pack())) for f in self.frames])
+        else:
+            out.update(text=self.text, color=self.color, font=self.font)
+            if self.kind == SCROLL:
+                out['direction'] = self.direction
+        return out
+
+    @classmethod
+    def fromdict(cls, d):
+        """Item from a dict as made by `todict`. Raises ValueError if it
+        doesn't describe a valid item."""
+        if not isinstance(d, dict):
+            raise ValueError("Bad playlist item: {0!r} isn't an object.".format(d))
+        d = dict(d)
+        kind = d.pop('kind', None)
+        try:
+            if kind == FRAMES:
+                width, height = int(d.pop('width')), int(d.pop('height'))
+                d['frames'] = [frame.Frame.unpack(width, height, base64.b64decode(f))
+                               for f in d.pop('frames')]
+            for name in ('duration', 'interval'):
+                if d.get(name) is not None:
+                    d[name] = float(d[name])
+            for name in ('repeat', 'color', 'direction'):
+                if d.get(name) is not None:
+                    d[name] = int(d[name])
+            return cls(kind, **d)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError("Bad playlist item: {0}".format(e))
+
+
+class Playlist(object):
+    """Named list of `Item`s, played in order and, if `loop`, over and
+    over."""
+
+    def __init__(self, name, items=(), loop=True):
+        self.name = name
+        self.items = list(items)
+        self.loop = loop
+
+    def todict(self):
+        return dict(name=self.name, loop=self.loop,
+                    items=[item.todict() for item in self.items])
+
+    @classmethod
+    def fromdict(cls, d):
+        if not isinstance(d, dict) or not d.get('name'):
+            raise ValueError("A playlist needs a name.")
+        if not isinstance(d.get('items', []), list):
+            raise ValueError("A playlist's items must be a list.")
+        return cls(d['name'], [Item.fromdict(item) for item in d.get('items', [])],
+                   bool(d.get('loop', True)))
+
+
+class Prepared(object):
+    """An item made ready to show: its `frames`, or its `scroll` (a
+    `(bitmap, scroller)` pair), and how long to show it for."""
+
+    def __init__(self, item, frames=None, scroll=None, duration=DEFAULT_DURATION):
+        self.item = item
+        self.frames, self.scroll = frames, scroll
+        self.duration = duration
+
+
+class Player(object):
+    """Plays `playlist` on `sign` from a background thread. The playlist can
+    be edited while it plays; changes are picked up from the next item
+    prepared. `late` counts switches that had to wait for an item to be
+    prepared."""
+
+    def __init__(self, sign, playlist):
+        self.sign = sign
+        self.playlist = playlist
+        self.thread = None
+        self.running = False
+        self.wake = threading.Event()
+        self.current = None
+        self.late = 0
+
+    def prepare(self, item):
+        """Render `item` (so that showing it is just a flip) and work out
+        how long it's shown for."""
+        sign = self.sign
+        duration = item.duration
+        if item.kind == FRAMES:
+            if any((f.width, f.height) != (sign.WIDTH, sign.HEIGHT) for f in item.frames):
+                raise ValueError("Frames must be {0}x{1}.".format(sign.WIDTH, sign.HEIGHT))
+            prepared = Prepared(item, frames=item.frames)
+            if duration is None and item.repeat:
+                duration = item.repeat * len(item.frames) * item.interval
+        elif item.kind == STATIC:
+            try:
+                prepared = Prepared(item, frames=[sign.renderStatic(item.text, item.color,
+                                                                    item.font)])
+            except ValueError:
+                # Too long, so it's scrolled instead (as in the web app)
+                return self.prepare(Item(SCROLL, item.text + " " * 3, item.color, item.font,
+                                         duration=item.duration, repeat=item.repeat))
+        else:
+            prepared = Prepared(item, scroll=sign.prepareScroll(
+                item.text, item.color, item.direction, True, item.font))
+            if duration is None and item.repeat:
+                bitmap, strip = prepared.scroll
+                speed = sign.channel.scrollspeed or 20.0
+                duration = (sign.WIDTH + item.repeat * strip.cycle) / speed
+        if duration is not None:
+            prepared.duration = duration
+        return prepared
+
+    def _next(self, index):
+        """Index and item after `index` (None if the playlist has ended)."""
+        items = self.playlist.items
+        index += 1
+        if index >= len(items):
+            if not self.playlist.loop or not items:
+                return None, None
+            index = 0
+        return index, items[index]
+
+    def _prerender(self):
+        batches = {}
+        for item in self.playlist.items:
+            if item.kind != FRAMES:
+                batches.setdefault((item.color, item.font), []).append(item.text)
+        for (color, font), texts in batches.items():
+            try:
+                self.sign.prerender(texts, color, font)
+            except ValueError:
+                pass  # e.g. a font that isn't loaded; shows up when prepared
+
+    def _flip(self, shown):
+        """Put the frame `shown` on the sign (blank or not)."""
+        sign = self.sign
+        sign.buffer = shown.copy()
+        sign.worker.start()
+        sign.channel.show(sign.buffer)
+        sign.displayProcess = sign.worker.process
+
+    def _show(self, prepared, until):
+        """Show `prepared` until the time `until` (or until stopped)."""
+        sign, item = self.sign, prepared.item
+        self.current = item
+        if prepared.scroll:
+            sign.dotArray, sign.scroller = prepared.scroll
+            sign.scroll()
+        elif item.kind != FRAMES:
+            self._flip(prepared.frames[0])
+        else:
+            index, shown = 0, time.time()
+            while True:
+                self._flip(prepared.frames[index])
+                index = (index + 1) % len(prepared.frames)
+                shown += item.interval
+                if shown >= until or self.wake.wait(max(0.0, shown - time.time())):
+                    break
+        if item.kind != FRAMES:
+            sign.currentMessage, sign.currentColor = item.text, item.color
+        self.wake.wait(max(0.0, until - time.time()))
+
+    def _upcoming(self, index):
+        """Index and prepared item for the next item after `index` that can
+        be prepared, skipping ones that can't (e.g. in a font that isn't
+        loaded). `(index, None)` if there isn't one."""
+        for attempt in range(len(self.playlist.items)):
+            index, item = self._next(index)
+            if item is None:
+                break
+            try:
+                return index, self.prepare(item)
+            except ValueError:
+                pass
+        return index, None
+
+    def run(self):
+        self._prerender()
+        index, prepared = self._upcoming(-1)
+        due = time.time()
+        while self.running and prepared is not None:
+            until = due + prepared.duration
+            # Get the next item ready while this one's showing
+            result = {}
+            worker = threading.Thread(target=lambda: result.update(
+                upcoming=self._upcoming(index)))
+            worker.daemon = True
+            worker.start()
+            self._show(prepared, until)
+            if not self.running:
+                break
+            if worker.is_alive():
+                self.late += 1
+                worker.join()
+            index, prepared = result['upcoming']
+            # Stay on the schedule, unless preparing made us miss it
+            due = max(until, time.time())
+        self.running = False
+        self.current = None
+
+    def start(self):
+        """Start playing (from the first item)."""
+        self.stop()
+        self.running = True
+        self.wake.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop playing, leaving whatever is showing on the sign."""
+        self.running = False
+        self.wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
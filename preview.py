@@ -0,0 +1,202 @@
+"""Live preview of what a sign is showing, for any number of viewers.
+
+A `Broadcaster` samples the sign's display (see `worker.Channel.peek`) at
+most `fps` times a second from a thread of its own, and encodes each frame
+that has changed exactly once, however many viewers there are. Viewers
+`subscribe` and read the encoded frames from a short queue of their own; one
+that falls behind is skipped forward to a fresh keyframe rather than being
+allowed to hold anything up. Sampling only reads shared memory, so the
+display process never waits on a preview.
+
+Frames are encoded as text lines, ready to go out as Server-Sent Events:
+
+* `k <width> <height> <base64>`: a keyframe, the whole frame packed two bits
+  per pixel (see `frame.Frame.pack`);
+* `d <base64>`: a delta against the frame before, as runs of changed packed
+  bytes, each a 2 byte big-endian offset, a 1 byte length and the bytes.
+
+A static message costs nothing once sent, and a scroll step only sends the
+bytes that changed. Every `keyframe`-th frame is a keyframe anyway, so that
+viewers can't drift.
+
+The sampling thread only runs while someone is watching: the first
+`subscribe` starts it, and it ends by itself once the last viewer has
+unsubscribed (or on `stop`). It's a daemon thread, so it never keeps the
+program from exiting either.
+
+    >>> b = preview.Broadcaster(s, fps=10)
+    >>> viewer = b.subscribe()
+    >>> viewer.get(timeout=15)
+    [(1, 'k 80 8 AAAA...')]
+"""
+import base64
+import struct
+import threading
+import time
+from collections import deque
+
+RUN = struct.Struct('>HB')
+
+
+def encode_key(packed, width, height):
+    return 'k {0} {1} {2}'.format(width, height, base64.b64encode(str(packed)))
+
+
+def encode_delta(old, new):
+    """Delta line turning the packed frame `old` into `new` (the same
+    size), or None if they're the same."""
+    out = bytearray()
+    i, size = 0, len(new)
+    while i < size:
+        if old[i] == new[i]:
+            i += 1
+            continue
+        start = i
+        while i < size and old[i] != new[i] and i - start < 255:
+            i += 1
+        out += RUN.pack(start, i - start) + new[start:i]
+    if not out:
+        return None
+    return 'd ' + base64.b64encode(str(out))
+
+
+class Subscriber(object):
+    """One viewer's queue of `(sequence, line)` pairs, at most `maxlen`
+    long."""
+
+    def __init__(self, broadcaster, maxlen):
+        self.broadcaster = broadcaster
+        self.queue = deque(maxlen=maxlen)
+        self.behind = False
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds for encoded frames and return them
+        all (an empty list on timeout)."""
+        b = self.broadcaster
+        with b.cond:
+            if not self.queue:
+                b.cond.wait(timeout)
+            if self.behind:
+                # Dropped frames; start again from the current keyframe
+                self.behind = False
+                self.queue.clear()
+                key = b.current()
+                return [key] if key else []
+            out = list(self.queue)
+            self.queue.clear()
+        return out
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class Broadcaster(object):
+    """Samples `sign` up to `fps` times a second and fans the encoded frames
+    out to its subscribers: at most `maxsubscribers` of them (None for no
+    limit), each queueing up to `backlog` frames. Every `keyframe`-th frame
+    sent is a keyframe. Samples only while there are subscribers."""
+
+    def __init__(self, sign, fps=10.0, maxsubscribers=100, backlog=8, keyframe=50):
+        self.sign = sign
+        self.fps = fps
+        self.maxsubscribers = maxsubscribers
+        self.backlog = backlog
+        self.keyframe = keyframe
+        self.cond = threading.Condition()
+        self.subscribers = []
+        # Latest packed frame, and its keyframe once one has been asked for
+        self.packed = None
+        self.size = None
+        self.key = None
+        self.sequence = 0
+        self.sent = 0
+        self.thread = None
+        self.running = False
+
+    def subscribe(self):
+        """New `Subscriber`, starting with the current frame. Raises
+        RuntimeError if there are already `maxsubscribers`."""
+        with self.cond:
+            if self.maxsubscribers is not None and \
+                    len(self.subscribers) >= self.maxsubscribers:
+                raise RuntimeError("Too many preview subscribers.")
+            sub = Subscriber(self, self.backlog)
+            key = self.current()
+            if key:
+                sub.queue.append(key)
+            self.subscribers.append(sub)
+        self.start()
+        return sub
+
+    def current(self):
+        """`(sequence, keyframe)` for the latest frame sent, or None. Only
+        encoded when asked for, and then just once. Call with `cond` held."""
+        if self.packed is None:
+            return None
+        if self.key is None or self.key[0] != self.sequence:
+            width, height = self.size
+            self.key = (self.sequence, encode_key(self.packed, width, height))
+        return self.key
+
+    def unsubscribe(self, sub):
+        with self.cond:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+
+    def start(self):
+        """Start sampling, if it isn't already going. (`subscribe` does
+        this; with nobody subscribed, sampling stops straight away.)"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling, and wait for the thread to end."""
+        with self.cond:
+            self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def sample(self):
+        """Encode the sign's current frame, if it has changed, and send it
+        to every subscriber. Returns the line sent, or None."""
+        shown = self.sign.channel.peek()
+        packed = shown.pack()
+        if self.packed is not None and len(packed) == len(self.packed) and \
+                self.sent % self.keyframe:
+            line = encode_delta(self.packed, packed)
+            if line is None:
+                return None
+        else:
+            line = encode_key(packed, shown.width, shown.height)
+        with self.cond:
+            self.sequence += 1
+            self.sent += 1
+            self.packed, self.size = packed, (shown.width, shown.height)
+            item = (self.sequence, line)
+            if line[0] == 'k':
+                self.key = item
+            for sub in self.subscribers:
+                if len(sub.queue) == sub.queue.maxlen:
+                    sub.behind = True
+                sub.queue.append(item)
+            self.cond.notify_all()
+        return line
+
+    def run(self):
+        while True:
+            started = time.time()
+            with self.cond:
+                if not self.running or not self.subscribers:
+                    # Nobody watching: stop until the next viewer, who
+                    # starts from a keyframe
+                    self.running = False
+                    self.packed = None
+                    return
+            self.sample()
+            time.sleep(max(0.0, 1.0 / self.fps - (time.time() - started)))
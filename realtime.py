@@ -0,0 +1,104 @@
+"""Opt-in real-time settings for the display process.
+
+An ordinary process gets preempted by everything else on the Pi: the web
+app, other daemons, its own garbage collector. Each time that happens a row
+stays lit for too long, which shows up as a flicker or a brighter row. A
+`Realtime` asks the kernel to treat the display process better:
+
+* pin it to one CPU (ideally one kept free with `isolcpus=`);
+* run it under SCHED_FIFO, so ordinary processes can't preempt it;
+* lock its memory, so it never waits on a page fault;
+* turn off the cyclic garbage collector in the refresh loop, collecting
+  only while every sign is blank.
+
+    >>> s = sign.Sign(realtime=realtime.Realtime(cpu=3))
+    >>> signs = manager.SignManager(realtime=realtime.Realtime(cpu=3))
+
+Real-time scheduling and memory locking need root (or CAP_SYS_NICE and
+CAP_IPC_LOCK). Whatever isn't permitted is skipped; `apply` says what was
+done, and the metrics record it (`realtime_cpu`, `realtime_fifo`,
+`realtime_locked`) along with the `stalls` seen.
+"""
+import ctypes
+import ctypes.util
+import errno
+import gc
+import os
+
+SCHED_FIFO = 1
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+# Bytes in a glibc cpu_set_t
+CPUSETSIZE = 128
+
+
+class _SchedParam(ctypes.Structure):
+    _fields_ = [('sched_priority', ctypes.c_int)]
+
+
+def _libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (OSError, TypeError):
+        return None
+
+
+def _call(function, *args):
+    """Call a libc function; returns None if it worked, otherwise the error
+    message."""
+    if function is None:
+        return "not available"
+    if function(*args) == 0:
+        return None
+    return os.strerror(ctypes.get_errno() or errno.ENOSYS)
+
+
+class Realtime(object):
+    """Settings for the display process: pin it to `cpu` (None to leave it
+    alone), run it under SCHED_FIFO at `priority` (None for the normal
+    scheduler), lock its memory if `lockmemory`, and keep the garbage
+    collector out of the refresh loop if `nogc`. A row slot that ends more
+    than `stall` seconds late counts as a stall (a whole slot, if None)."""
+
+    def __init__(self, cpu=None, priority=50, lockmemory=True, nogc=True, stall=None):
+        if cpu is not None and not 0 <= cpu < CPUSETSIZE * 8:
+            raise ValueError("No CPU {0}".format(cpu))
+        self.cpu = cpu
+        self.priority = priority
+        self.lockmemory = lockmemory
+        self.nogc = nogc
+        self.stall = stall
+
+    def apply(self, metrics=None):
+        """Apply the settings to the calling process. Returns a dict of what
+        was asked for and whether it was done (True, or the reason not),
+        and records the outcome in `metrics`, if given."""
+        libc = _libc()
+        done = {}
+        if self.cpu is not None:
+            mask = (ctypes.c_ubyte * CPUSETSIZE)()
+            mask[self.cpu // 8] = 1 << (self.cpu % 8)
+            done['cpu'] = _call(libc and libc.sched_setaffinity, 0, CPUSETSIZE, mask)
+        if self.priority is not None:
+            param = _SchedParam(self.priority)
+            done['fifo'] = _call(libc and libc.sched_setscheduler, 0, SCHED_FIFO,
+                                 ctypes.byref(param))
+        if self.lockmemory:
+            done['locked'] = _call(libc and libc.mlockall, MCL_CURRENT | MCL_FUTURE)
+        if self.nogc:
+            # Whatever is garbage now goes before the loop starts
+            gc.collect()
+            gc.disable()
+            done['nogc'] = None
+        done = dict((name, True if error is None else error) for name, error in done.items())
+        if metrics is not None:
+            metrics.set('realtime_cpu', self.cpu if done.get('cpu') is True else -1)
+            metrics.set('realtime_fifo', done.get('fifo') is True)
+            metrics.set('realtime_locked', done.get('locked') is True)
+        return done
+
+    def idle(self):
+        """Called when every sign has gone blank: collect garbage then, if
+        the collector is kept out of the refresh loop."""
+        if self.nogc:
+            gc.collect()
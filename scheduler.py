@@ -0,0 +1,157 @@
+"""Deadline-driven pacing for the refresh loop.
+
+Left to itself, the refresh loop runs as fast as the CPU allows: rows stay
+lit for however long the next row takes to shift in, and scrolling moves a
+column per frame, so brightness and speed depend on the Pi and its load.
+A `Scheduler` divides time into equal row slots on a fixed grid instead, so
+a frame takes `height` slots whatever the hardware. Each row is shifted in
+with the display blanked, lit, and held until its slot ends; scrolling is
+measured in columns per second.
+
+A row can also be shown in several weighted steps that share its slot (for
+bit-angle modulation and dimming; see `frameprog`). Shifting a step in
+takes time too, and the shortest steps can be shorter than a shift, so the
+time a row spends shifting is measured and budgeted inside its slot: each
+step is lit for `weight * (slot - shift)`, timed from when it's latched,
+and the row's last step ends on the grid. Several signs can keep places of
+their own on the same grid (a `Track` each; see `worker.RefreshWorker`).
+
+    >>> sched = scheduler.Scheduler(8, refresh=100, scrollspeed=20)
+    >>> program.replay(ldp.writer, sched.hold)
+    >>> scroller.step(sched.columns())
+
+"""
+import time
+from timeit import default_timer
+
+# Leeway in a row's total weight for rounding (a row is done at 1.0)
+EPSILON = 1e-6
+
+
+class Track(object):
+    """One sign's place on a `Scheduler`'s grid: when its current row's slot
+    started, how much of the row (by weight) has been shown and how long it
+    has spent shifting so far, and the shift time measured over its last
+    row, which is budgeted for in the next."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start afresh at the next step (e.g. after the sign was blank)."""
+        self.deadline = None  # end of the last step
+        self.start = None
+        self.done = 0.0
+        self.shifting = 0.0
+        self.shift = 0.0
+
+
+class Scheduler(object):
+    """Row pacing for a sign `height` rows tall, refreshed `refresh` times a
+    second (None to run flat out), scrolling `scrollspeed` columns a second
+    (None for one column per frame).
+
+    `missed` counts steps that weren't lit until after their row's slot had
+    ended; when that happens the grid restarts from the current time rather
+    than trying to catch up. `stalls` counts slots that ended more than
+    `stall` seconds late (a whole slot, if None), long enough for a row to
+    visibly flicker. If `metrics` (a `metrics.Metrics`) is given, how late
+    each slot ended goes into its row jitter histogram.
+    """
+
+    # Sleep until this close to a deadline, then spin (seconds)
+    SPIN = 0.0002
+
+    def __init__(self, height, refresh=100.0, scrollspeed=20.0,
+                 clock=default_timer, sleep=time.sleep, metrics=None):
+        self.height = height
+        self.metrics = metrics
+        self.refresh, self.scrollspeed = refresh, scrollspeed
+        self.slot = 1.0 / (refresh * height) if refresh else 0.0
+        self.clock, self.sleep = clock, sleep
+        self.missed = 0
+        self.stalls = 0
+        self.stall = None
+        self.rows = 0
+        self.track = Track()
+        self.reset()
+
+    def reset(self):
+        """Start a new grid at the next row (e.g. after the display has been
+        idle), without counting the gap as missed deadlines."""
+        self.track.reset()
+        self.scrolled = None
+        self.carry = 0.0
+
+    def hold(self, weight=1.0):
+        """Called once a row is lit; returns when its step is over. `weight`
+        is the share of the row's slot the step takes (see `after`)."""
+        self.wait(self.after(self.track, weight))
+
+    def after(self, track, weight=1.0):
+        """Deadline for a step of the sign on `track` (a `Track`) that has
+        just been lit, taking `weight` of its row's slot. The steps of a row
+        have weights adding up to 1; the last one ends where the row's slot
+        does, on the grid, and the others are lit for `weight` of what's
+        left of the slot once shifting is taken out."""
+        self.rows += 1
+        if not self.slot:
+            return None
+        now = self.clock()
+        slot = self.slot
+        if track.deadline is None:
+            # First step: nothing to measure its shift from
+            track.start, track.done, track.shifting = now, 0.0, 0.0
+        else:
+            if track.done == 0.0:
+                track.start = track.deadline
+            track.shifting += max(now - track.deadline, 0.0)
+            if now > track.start + slot:
+                self.missed += 1
+                self._late(now - track.start - slot)
+                track.start = now
+        track.done += weight
+        end = track.start + slot
+        if track.done >= 1.0 - EPSILON:
+            deadline = end
+            track.shift, track.done, track.shifting = track.shifting, 0.0, 0.0
+        else:
+            deadline = min(now + weight * max(slot - track.shift, 0.0), end)
+        track.deadline = max(deadline, now)
+        return track.deadline
+
+    def wait(self, deadline):
+        """Return at `deadline` (straight away if it's None or past)."""
+        if deadline is None:
+            return
+        now = self.clock()
+        remaining = deadline - now
+        if remaining <= 0:
+            return
+        if remaining > self.SPIN:
+            self.sleep(remaining - self.SPIN)
+        now = self.clock()
+        while now < deadline:
+            now = self.clock()
+        self._late(now - deadline)
+
+    def _late(self, lateness):
+        if lateness > (self.slot if self.stall is None else self.stall):
+            self.stalls += 1
+        if self.metrics:
+            self.metrics.observe('row_jitter_seconds', lateness)
+
+    def columns(self):
+        """Number of columns to scroll by now, given the time since the last
+        call."""
+        if not self.scrollspeed:
+            return 1
+        now = self.clock()
+        if self.scrolled is None:
+            self.scrolled = now
+            return 0
+        self.carry += (now - self.scrolled) * self.scrollspeed
+        self.scrolled = now
+        steps = int(self.carry)
+        self.carry -= steps
+        return steps
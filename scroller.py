@@ -0,0 +1,169 @@
+"""Scrolling as a moving window over a prepared strip of columns.
+
+The message bitmap is laid out once, together with its padding, in a single
+`frame.Frame` (the "strip"). Each scroll step only moves `offset`, the first strip
+column in view; nothing is copied. For wrap-around, the strip carries enough
+of the message's start after its end that every window is contiguous.
+
+    >>> sc = scroller.Scroller(s.drawText("Hello  ", s.RED), s.WIDTH, s.HEIGHT)
+    >>> sc.show(ldp.writer)
+    >>> sc.step()
+    True
+
+
+Building the strip is the expensive part, and it doesn't change for a given
+message, so a prepared `Scroller` can be kept and `copy`-ed to scroll the
+same message again (see `Sign.scrolls`).
+"""
+from array import array
+
+import frame
+
+FORWARD = 1
+BACKWARD = -1
+
+
+class Scroller(object):
+    """Viewport of `width` columns over the message bitmap `dotArray`.
+
+    The message scrolls in from a blank display (`lead` blank columns,
+    defaulting to the full width) and then repeats with `trail` blank
+    columns between repetitions. With `wrap=False` it scrolls off once and
+    `step` returns False from then on. `direction` is `FORWARD` (the
+    direction `Sign.scrollLoop` has always scrolled) or `BACKWARD`.
+    """
+
+    def __init__(self, dotArray, width, height, lead=None, trail=0,
+                 direction=FORWARD, wrap=True):
+        self.width, self.height = width, height
+        self.direction, self.wrap = direction, wrap
+        lead = width if lead is None else lead
+
+        # One repetition of the message plus its trailing gap, and a
+        # display's width of what comes after it (before it, when scrolling
+        # backward): more repetitions when wrapping, blank otherwise.
+        cycle = [bytearray(dotArray[row]) + bytearray(trail) for row in range(height)]
+        self.cycle = len(cycle[0])
+        if wrap and self.cycle:
+            copies = width // self.cycle + 1
+            fill = [row * copies for row in cycle]
+        else:
+            fill = [bytearray(width) for row in cycle]
+
+        if direction == FORWARD:
+            rows = [bytearray(lead) + cycle[row] + fill[row][:width]
+                    for row in range(height)]
+            self.first = lead
+            self.offset = 0
+        else:
+            rows = [fill[row][-width:] + cycle[row] + bytearray(lead)
+                    for row in range(height)]
+            self.first = 0
+            self.offset = len(rows[0]) - width
+        self.strip = frame.Frame(len(rows[0]), height, bytearray().join(rows))
+
+        # Running count of lit pixels along each row of the strip, so
+        # whether a row of the window is blank is a single subtraction
+        self.litcounts = []
+        for row in rows:
+            counts, total = array('I', [0]), 0
+            for value in row:
+                total += value != 0
+                counts.append(total)
+            self.litcounts.append(counts)
+        self.start = self.offset
+
+    def copy(self):
+        """A new scroller over the same message, back at its start. The strip
+        is shared, not copied."""
+        other = object.__new__(Scroller)
+        other.__dict__.update(self.__dict__)
+        other.offset = self.start
+        return other
+
+    def nbytes(self):
+        """Memory taken by the strip and the lit pixel counts."""
+        return len(self.strip.data) + sum(counts.itemsize * len(counts)
+                                          for counts in self.litcounts)
+
+    def done(self):
+        """True once a non-wrapping scroll has left the display blank."""
+        if self.direction == FORWARD:
+            return self.offset >= self.first + self.cycle
+        return self.offset <= 0
+
+    def step(self, columns=1):
+        """Advance the viewport by `columns`. Returns False if the scroll has
+        finished (only possible with `wrap=False`)."""
+        if not self.wrap:
+            if self.done():
+                return False
+            self.offset += self.direction * columns
+            if self.direction == FORWARD:
+                self.offset = min(self.offset, self.first + self.cycle)
+            else:
+                self.offset = max(self.offset, 0)
+            return True
+        self.offset += self.direction * columns
+        if self.cycle:
+            if self.direction == FORWARD:
+                if self.offset >= self.first + self.cycle:
+                    self.offset = self.first + (self.offset - self.first) % self.cycle
+            elif self.offset < 0:
+                self.offset %= self.cycle
+        return True
+
+    def column(self, col):
+        """Colours in display column `col` of the current window."""
+        return list(self.strip.column(self.offset + col))
+
+    def window(self):
+        """Copy of the current window as a list of rows (for inspection; the
+        refresh path doesn't need it)."""
+        return self.strip.columns(self.offset, self.offset + self.width).tolist()
+
+    def litrows(self):
+        """Rows of the current window with something lit in them."""
+        o, w = self.offset, self.width
+        return [row for row in range(self.height)
+                if self.litcounts[row][o + w] != self.litcounts[row][o]]
+
+    def show(self, writer, hold=None):
+        """Shift the current window out through `writer` (an
+        `ldp.PinWriter`), one row at a time, with the display blanked while
+        each row is shifted in (in parallel across the writer's lanes, if
+        it has more than one). Blank rows are skipped, leaving the display
+        off. `hold`, if given, is called with a weight of 1.0 after each
+        row is lit (see `scheduler.Scheduler.hold`), or once per row if
+        nothing is lit. Shaded pixels are shown in their plain colour."""
+        for weight in self.scan(writer):
+            if hold:
+                hold(weight)
+
+    def scan(self, writer):
+        """Generator form of `show`: yields the weight 1.0 each time a row
+        has been lit (or, with nothing lit, once per row), like
+        `frameprog.Program.scan`."""
+        data, stride = self.strip.data, self.strip.width
+        colourshift, EN = writer.colourshift, writer.map.EN
+        lanes = len(writer.map.lanes)
+        step = self.width // lanes
+        lit = self.litrows()
+        if not lit:
+            writer.set(EN, 0)
+            for row in range(self.height):
+                yield 1.0
+            return
+        for row in reversed(lit):
+            writer.set(EN, 0)
+            start = row * stride + self.offset
+            if lanes == 1:
+                for i in xrange(start, start + self.width):
+                    colourshift(data[i])
+            else:
+                # Column i of every lane goes in with the same shift
+                window = data[start:start + self.width]
+                for i in xrange(step):
+                    writer.shiftcolumn(window[i::step])
+            writer.showrow(row)
+            yield 1.0
@@ -1,9 +1,16 @@
 #!/usr/bin/python
 import sys
 import time
-from multiprocessing import Process, Value
-import fontv
+from multiprocessing import Value
+import frame
+import frameprog
 import ldp
+import lru
+import metrics
+import raster
+import scroller
+import template
+from worker import Channel, RefreshWorker
 
 class SignDisplayError(Exception): pass
 
@@ -18,6 +25,27 @@ class Sign(object):
     >>> s.stop()
     >>> s.staticPut("Testing")
     >>> s.static()
+
+    The display is refreshed `refresh` times a second, with every row lit
+    for the same time, and text scrolls at `scrollspeed` columns a second
+    (see `scheduler.Scheduler`).
+
+    Wider signs are made by chaining panels. `pinmap` (an `ldp.PinMap`,
+    `ldp.PINMAP` by default) says which pins drive them; with several data
+    lanes, `width` is split evenly between them and they're shifted in
+    parallel, so a 320 column sign on four lanes refreshes as fast as an 80
+    column one.
+
+    Several signs can share one display process: pass the same `worker`
+    (a `worker.RefreshWorker`) to each, along with its own `pinmap`, or use
+    `manager.SignManager`, which does that for you. `backend` is the
+    `gpiobackend` backend to drive the pins with (`ldp.backend` by
+    default). A sign given neither `pinmap` nor `backend` drives the pins
+    of `ldp`'s module functions.
+
+    `realtime` (a `realtime.Realtime`) puts the display process into
+    real-time mode, pinned to a CPU and out of the way of the rest of the
+    system.
     
     """
     
@@ -28,51 +56,123 @@ class Sign(object):
     
     # Display color names
     COLORNAMES = {1: 'red', 2: 'green', 3: 'orange', 4: 'blank'}
+
+    # Recently rendered message bitmaps, shared by all signs
+    rendered = lru.LRUCache(128)
+
+    # Scrolls prepared by scrollPut, as (bitmap, scroller) pairs, shared by
+    # all signs. Set `Sign.scrolls.maxbytes` to change the memory budget.
+    scrolls = lru.LRUCache(256, maxbytes=8 * 2**20,
+                           sizeof=lambda prepared: len(prepared[0].data) + prepared[1].nbytes())
     
-    def __init__(self, width=80, height=8):
+    def __init__(self, width=80, height=8, refresh=100.0, scrollspeed=20.0,
+                 pinmap=None, worker=None, backend=None, realtime=None):
         self.WIDTH, self.HEIGHT = width, height
-        self.buffer = [[0 for i in xrange(self.WIDTH)] for i in xrange(self.HEIGHT)]    
+        # Raises ValueError if the width doesn't split evenly between lanes
+        if pinmap is None and backend is None:
+            ldp.setpinmap(ldp.PINMAP.forwidth(width))
+            self.writer = ldp.writer
+        else:
+            pinmap = (pinmap or ldp.PINMAP).forwidth(width)
+            self.writer = ldp.PinWriter(backend or ldp.backend, pinmap)
+        self.buffer = frame.Frame(self.WIDTH, self.HEIGHT)
         
         self.isOn = False
         self.displayProcess = False
+        self.metrics = metrics.Metrics()
+        if worker is None:
+            worker = RefreshWorker(refresh, self.metrics, realtime)
+        self.worker = worker
+        self.channel = worker.add(Channel(self.WIDTH, self.HEIGHT, self.writer,
+                                          scrollspeed, self.metrics))
         self._continue = Value('b', 0)
         
         self.currentMessage = ""
         self.currentColor = 4
+        # Font for text when none is given (see fonts.py)
+        self.font = 'fontv'
         
-        ldp.init()
+        self.writer.init()
         
     def getColor(self):
         return self.COLORNAMES[self.currentColor]
+
+    @property
+    def brightness(self):
+        """Brightness of the whole sign, from 0 (off) to 1 (full). Takes
+        effect on the next row shown by the display process; the old
+        display loops always run at full brightness."""
+        return self.channel.brightness.value
+
+    @brightness.setter
+    def brightness(self, value):
+        self.channel.brightness.value = max(0.0, min(float(value), 1.0))
+
+    @property
+    def buffer(self):
+        """Bitmap to display, as a `frame.Frame` (indexed `buffer[row][col]`).
+        A list of rows of color values can be assigned too; it's copied into
+        a new frame. Either way it has to be the size of the sign."""
+        return self._buffer
+
+    @buffer.setter
+    def buffer(self, value):
+        if not isinstance(value, frame.Frame):
+            value = frame.Frame.fromrows(value)
+        if (value.width, value.height) != (self.WIDTH, self.HEIGHT):
+            raise ValueError("Buffer is {0}x{1}, the sign is {2}x{3}.".format(
+                value.width, value.height, self.WIDTH, self.HEIGHT))
+        self._buffer = value
+        self.invalidate()
+
+    def invalidate(self):
+        """Discard the compiled frame program so that `showbuffer` rebuilds
+        it from the current buffer. Changes made through the buffer are
+        noticed without this; it's only needed if you write to
+        `buffer.data` directly."""
+        self._program = None
+
+    def compile(self):
+        """Compile the buffer into the frame program replayed by
+        `showbuffer` (done lazily if not called beforehand)."""
+        self._program = frameprog.compile(self._buffer, self.WIDTH, self.HEIGHT,
+                                          self.writer.map)
+        self._programVersion = self._buffer.version
+        return self._program
         
     ###### Sign hardware functions: general ######
         
     def on(self): 
         """Turn display on."""
         self.isOn = True
-        ldp.displayon()
+        self.writer.set(self.writer.map.EN, 1)
         
     def off(self): 
         """Turn display off."""
         self.isOn = False
-        ldp.displayoff()    
+        self.writer.set(self.writer.map.EN, 0)    
         
     def clear(self):
         """Zero out hardware buffer so that no LEDs will be on."""
-        ldp.clear()
+        if self.worker.running():
+            # The display process owns the pins while it's up
+            self.channel.blank()
+        else:
+            self.writer.clear()
         
     ###### Local bitmap buffer management functions ######    
     
     def clearbuffer(self):
         """Zero out the buffer for this class."""
-        self.buffer = [[0 for i in xrange(self.WIDTH)] for i in xrange(self.HEIGHT)]    
+        self.buffer.clear()
 
     def shiftbuffer(self):
         """function to shift left all the vaules of the matrix array 
         this allows us to put new data in the first column"""
-    	for row in range(self.HEIGHT):
-    		for col in range(self.WIDTH-1,0,-1):
-    			self.buffer[row][col] = self.buffer[row][col-1]
+        data = self.buffer.data
+        for base in xrange(0, len(data), self.WIDTH):
+            data[base+1:base+self.WIDTH] = data[base:base+self.WIDTH-1]
+        self.buffer.version += 1
                 
     ###### Display functions ######    
                 
@@ -80,18 +180,30 @@ class Sign(object):
         """function to read the matrix array and output the values to the display device"""    
         self.off()
         
-        hscope, wscope = xrange(self.HEIGHT), xrange(self.WIDTH)
-                
-    	for row in range(self.HEIGHT):
-    		for col in range(self.WIDTH):
-    			ldp.colourshift(self.buffer[row][col])
-    		ldp.showrow(row)
+        program = self._program
+        if program is None:
+            program = self.compile()
+        elif self._programVersion != self._buffer.version:
+            # Only the rows that changed get recompiled
+            program.update(self._buffer)
+            self._programVersion = self._buffer.version
+        program.replay(self.writer)
+        self.writer.endframe()
         
     def showbufferRev(self):
+        data, width, writer = self.buffer.data, self.WIDTH, self.writer
+        lanes = len(writer.map.lanes)
+        step = width // lanes
     	for row in reversed(range(self.HEIGHT)):
-    		for col in reversed(range(self.WIDTH)):
-    			ldp.colourshift(self.buffer[row][col])
-    		ldp.showrow(row)
+    		if lanes == 1:
+    			for col in reversed(range(self.WIDTH)):
+    				writer.colourshift(data[row*width+col])
+    		else:
+    			line = data[row*width:(row+1)*width][::-1]
+    			for col in range(step):
+    				writer.shiftcolumn(line[col::step])
+    		writer.showrow(row)
+        writer.endframe()
                     
     def staticLoop(self):
         """Main display loop (static). Usually run inside a thread; don't call this
@@ -105,127 +217,188 @@ class Sign(object):
         thread; don't call directly unless you're testing."""     
             
         while self._continue.value == 1:
-            for col in range(len(self.dotArray[0])):
-                for row in range(self.HEIGHT):
-                    self.buffer[row][0] = (self.dotArray[row][col])
-                self.showbufferRev()  # display  
-                self.shiftbuffer() # lshift the buffer
+            self.scroller.show(self.writer)  # display
+            self.writer.endframe()
+            self.scroller.step()  # move the viewport along a column
             
     def scroll(self, interval=-1):        
-        """Scroll the bitmap in `self.buffer` to the display for `interval` 
-        seconds (`interval = -1` is forever). This spawns a separate thread 
-        that will display for the specified number of seconds, or until 
-        `self.stop` is called."""
-        
-        empty = [[0 for i in xrange(self.WIDTH)] for i in xrange(self.HEIGHT)]    
+        """Scroll the text from `self.scrollPut` on the display for `interval` 
+        seconds (`interval = -1` is forever). The display process (started
+        on first use) keeps it scrolling until `self.stop` is called or
+        something else is displayed; whatever was showing before is
+        replaced without blanking the sign."""
         
-        if self.displayProcess:
-            raise SignDisplayError("There is already a display loop running.")
-        elif not hasattr(self, "dotArray") or not self.dotArray:
+        if not hasattr(self, "dotArray") or not self.dotArray:
             raise SignDisplayError("Please put text on the sign using scrollPut.")
         else: 
-            # Clear the buffer from `put` because the buffer is continually
-            # updated during the scroll process.
             if interval == -1:
-                self._continue = Value('b', 1) # run flag
-                self.displayProcess = Process(target=self.scrollLoop) # create thread
-                self.displayProcess.start() # start display        
+                self.worker.start()
+                self.channel.scroll(self.scroller)
+                self.displayProcess = self.worker.process
     
     def static(self, interval=-1):        
         """Push the bitmap in `self.buffer` to the display for `interval` 
-        seconds (`interval = -1` is forever). This spawns a separate thread 
-        that will display for the specified number of seconds, or until 
-        `self.stop` is called."""
-        empty = [[0 for i in xrange(self.WIDTH)] for i in xrange(self.HEIGHT)]    
-        if self.displayProcess:
-            raise SignDisplayError("There is already a display loop running.")
-        elif self.buffer == empty:
-            # Do nothing, empty sign.
-            pass
+        seconds (`interval = -1` is forever). The display process (started
+        on first use) keeps it up until `self.stop` is called or something
+        else is displayed; whatever was showing before is replaced without
+        blanking the sign. A blank buffer blanks the sign."""
+        if self.buffer.isblank():
+            # Nothing to refresh, but whatever was showing has to go
+            self.channel.blank()
+            self.displayProcess = False
         else: 
             if interval == -1:
-                self._continue = Value('b', 1) # run flag
-                self.displayProcess = Process(target=self.staticLoop) # create thread
-                self.displayProcess.start() # start display
-                
+                self.worker.start()
+                self.channel.show(self.buffer)
+                self.displayProcess = self.worker.process
+
+    def animate(self, animation):
+        """Play `animation` (an `animation.Animation` the size of the sign)
+        until `self.stop` is called or something else is displayed."""
+        if (animation.width, animation.height) != (self.WIDTH, self.HEIGHT):
+            raise SignDisplayError("Animation is {0}x{1}, the sign is {2}x{3}.".format(
+                animation.width, animation.height, self.WIDTH, self.HEIGHT))
+        if not len(animation):
+            raise SignDisplayError("Animation has no frames.")
+        self.worker.start()
+        self.channel.animate(animation)
+        self.displayProcess = self.worker.process
+
     def stop(self):
-        """Clear the buffer, display, and other associated state variables."""
+        """Clear the buffer, display, and other associated state variables.
+        The display process stays up, ready for the next message."""
         
         if not self.displayProcess:
             raise Exception("There is no display loop running.")
         else:
-            self._continue.value = 0 # stop the loop
-            self.displayProcess.join() # stop the thread
-            self.displayProcess = False # remove the subprocess pointer
-            self.clear() # clear the hardware buffer
+            self.channel.blank() # clear the hardware buffer
+            self.displayProcess = False # nothing is being displayed
             self.currentMessage = "" # clear the current message string
+
+    def shutdown(self):
+        """Blank the sign and end the display process (along with any other
+        signs it drives)."""
+        self.worker.shutdown()
+        self.displayProcess = False
+        self.currentMessage = ""
+
+    def profile(self, enable=True):
+        """Turn the display process's sampling profiler on or off. When it's
+        turned off, the report is written to the file whose path this
+        returns."""
+        m = self.worker.metrics
+        m.profiling.value = 1 if enable else 0
+        return m.profilePath
                 
     ###### Write functions ######                   
-    def drawText(self, text, color):
+    def drawText(self, text, color, font=None):
         """Push the string `text`, to be displayed in `color`, to the software
-        bitmap buffer.  This can later be displayed by calling `self.display`."""
+        bitmap buffer.  This can later be displayed by calling `self.display`.
+        `font` names the font to use (see `fonts`); it defaults to
+        `self.font`."""
         
         # Initialize sign
-        text = str(text).encode('ascii', 'ignore')
         self.clearbuffer()
+        return self._render(text, color, font)
+
+    def _render(self, text, color, font=None):
+        """Bitmap of `text` (a copy; see `drawText`)."""
+        started = time.time()
+        text = raster.decode(text)
+        font = font or self.font
+
+        # Messages repeat a lot, so reuse earlier renders when we can
+        key = (text, color, font, self.HEIGHT)
+        rendered = self.rendered.get(key)
+        if rendered is None:
+            # Build the bitmap that we want to display on the sign
+            rendered = raster.render(text, color, self.HEIGHT, font)
+            self.rendered.put(key, rendered)
+
+        self.metrics.observe('render_seconds', time.time() - started)
+        return rendered.copy()
+
+    def prerender(self, texts, color=RED, font=None):
+        """Render all of `texts` in `color` ahead of time, in one batch, so
+        that later `drawText` calls for them are cache hits."""
+        started = time.time()
+        font = font or self.font
+        texts = [raster.decode(text) for text in texts]
+        missing = [text for text in texts
+                   if (text, color, font, self.HEIGHT) not in self.rendered]
+        rendered = raster.render_many(missing, color, self.HEIGHT, font)
+        for text, bitmap in zip(missing, rendered):
+            self.rendered.put((text, color, font, self.HEIGHT), bitmap)
+        self.metrics.observe('render_seconds', time.time() - started)
         
-        # Get the ascii values to lookup bitmap letters in the font
-        inputArray = [ord(char) for char in text]
-        dotArray = [ [] for row in xrange(self.HEIGHT) ]
-        
-        # Build the bitmap that we want to display on the sign
-        # by filling the array with the relevant color digits
-        for row in range(self.HEIGHT):
-            for asciiChr in inputArray:
-                # Width of character (number of LEDs lit)
-                width = fontv.array[asciiChr][0]
-                chrBitmap = fontv.array[asciiChr][row+1]
-                binary = '{0:{fill}{align}{width}{base}}'.format(chrBitmap, base='b', fill='0', align='>', width=width)
-
-                # Populate the array
-                for digit in range(width):
-                    if binary[digit] == '0':
-                        dotArray[row].append(0)
-                    else:
-                        dotArray[row].append(color)
-
-        return dotArray                
-        
-    def staticPut(self, text, color=RED):
-        """Draw the formatted text bitmap to buffer for a static display."""                            
-        dotArray = self.drawText(text, color)
+    def renderStatic(self, text, color=RED, font=None):
+        """Frame showing `text` centred on the display, without touching the
+        buffer. Raises ValueError if the text is too wide."""
+        dotArray = self._render(text, color, font)
         
         # Width of raw message bitmap, so we can do some bounds checking
-        totalWidth = len(dotArray[0])                
+        totalWidth = dotArray.width
         
         if totalWidth > self.WIDTH:
-            self.dotArray = dotArray    
             raise ValueError("Message larger than display. Maybe try scrolling instead?")
         
         # Create offset to center message if we want
         offset = int((self.WIDTH - totalWidth) / 2)
 
-        # Fill the matrix with spaces to center
-        for col in range(offset):
-        	for row in range(self.HEIGHT):
-        		self.buffer[row][col] = 0
-                                
-        # Fill the display matrix with the bitmap
-        for col in range(totalWidth):
-        	for row in range(self.HEIGHT):
-        		# copy the current dotarray column values to the first column in the matrix
-        		self.buffer[row][offset+col] = (dotArray[row][col])
+        shown = frame.Frame(self.WIDTH, self.HEIGHT)
+        shown.blit(dotArray, offset, 0)
+        return shown
+
+    def staticPut(self, text, color=RED, font=None):
+        """Draw the formatted text bitmap to buffer for a static display."""                            
+        self.clearbuffer()
+        try:
+            shown = self.renderStatic(text, color, font)
+        except ValueError:
+            self.dotArray = self._render(text, color, font)
+            raise
+
+        # Copy the centred bitmap into the display matrix
+        self.buffer.blit(shown, 0, 0)
                 
         self.currentMessage = text        
         self.currentColor = color
         
-    def scrollPut(self, text, color=RED):
+    def template(self, pattern, color=RED, font=None, align=template.CENTER, **values):
+        """Show `pattern` with its named fields filled in from `values`, as
+        a `template.Template` whose fields can be updated cheaply."""
+        t = template.Template(self, pattern, color, font, align, **values)
+        t.show()
+        return t
+
+    def prepareScroll(self, text, color=RED, direction=scroller.FORWARD, wrap=True,
+                      font=None):
+        """`(bitmap, scroller)` for scrolling `text`, ready to go, without
+        touching the sign's state (see `scrollPut`)."""
+        # Messages come round again and again, so prepared scrolls are
+        # kept and just restarted.
+        font = font or self.font
+        key = (raster.decode(text), color, font, self.WIDTH, self.HEIGHT, direction, wrap)
+        prepared = self.scrolls.get(key)
+        if prepared is None:
+            self.metrics.inc('scroll_cache_misses')
+            dotArray = self._render(text, color, font)
+            prepared = (dotArray, scroller.Scroller(dotArray, self.WIDTH, self.HEIGHT,
+                                                    direction=direction, wrap=wrap))
+            self.scrolls.put(key, prepared)
+        else:
+            self.metrics.inc('scroll_cache_hits')
+        return prepared[0].copy(), prepared[1].copy()
+
+    def scrollPut(self, text, color=RED, direction=scroller.FORWARD, wrap=True,
+                  font=None):
         """Generate the formatted text bitmap to buffer for a scrolling display.
         Drawing is handled by the display function here as it continually updates 
-        for scrolling purposes."""                            
+        for scrolling purposes. `direction` is `scroller.FORWARD` or
+        `scroller.BACKWARD`; with `wrap=False` the text scrolls past once."""                            
         
         # Place to hand off to display function
-        self.dotArray = self.drawText(text, color)
+        self.dotArray, self.scroller = self.prepareScroll(text, color, direction, wrap, font)
         self.currentMessage = text        
         self.currentColor = color
         
\ No newline at end of file
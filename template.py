@@ -0,0 +1,102 @@
+"""Templated messages for live data: clocks, counters, tickers.
+
+A `Template` is a message with named fields, like "Queue: {n}", laid out on
+a sign. It remembers which column every character starts at, so when a
+field changes only the characters that differ are rendered and patched
+into the sign's buffer; the rest of the line stays as it is. The display
+process then recompiles just the rows that changed (see
+`frameprog.Program.update`).
+
+    >>> queue = s.template("Queue: {n}", s.GREEN, n=0)
+    >>> queue.update(n=12)
+    >>> clock = s.template("{t:%H:%M:%S}", t=datetime.now())
+
+Fields are filled in with `str.format`, so format specs work as usual, and
+a fixed-width spec ("{n:>3}") keeps the rest of the line from moving when
+the value's length changes. If the line's width changes, centred text has
+to move as a whole and is rendered afresh.
+"""
+import time
+
+import fonts
+import frame
+import raster
+
+LEFT = 'left'
+CENTER = 'center'
+
+
+class Template(object):
+    """`pattern` shown on `sign` in `color` and `font`, aligned `LEFT` or
+    `CENTER`, with its fields set to `values`."""
+
+    def __init__(self, sign, pattern, color=1, font=None, align=CENTER, **values):
+        self.sign = sign
+        self.pattern = raster.decode(pattern)
+        self.color, self.font, self.align = color, font or sign.font, align
+        self.values = values
+        # What's laid out in the buffer: the text, each character's width,
+        # the column it starts from, and the buffer's version afterwards
+        self.text, self.widths, self.offset = None, [], 0
+        self.buffer, self.version = None, None
+
+    def format(self):
+        """The text with the fields filled in."""
+        return raster.decode(self.pattern.format(**self.values))
+
+    def update(self, **values):
+        """Set fields and show the result."""
+        self.values.update(values)
+        self.show()
+
+    def show(self):
+        """Lay the text out in the sign's buffer, patching only what's
+        changed since last time, and display it."""
+        self.layout()
+        self.sign.static()
+
+    def layout(self):
+        """Bring the sign's buffer in line with the text; returns the span
+        of columns `(start, stop)` that were redrawn."""
+        started = time.time()
+        sign = self.sign
+        text = self.format()
+        font = fonts.get(self.font)
+        widths = [len(font.glyph(ord(char))[0]) for char in text]
+        total = sum(widths)
+        if total > sign.WIDTH:
+            raise ValueError("Message larger than display. Maybe try scrolling instead?")
+        offset = (sign.WIDTH - total) // 2 if self.align == CENTER else 0
+
+        buffer = sign.buffer
+        if self.text is None or offset != self.offset or buffer is not self.buffer or \
+                buffer.version != self.version:
+            # Nothing (usable) to patch; lay out the whole line
+            buffer.clear()
+            start, stop, first, last = 0, sign.WIDTH, 0, len(text)
+        else:
+            old, oldwidths = self.text, self.widths
+            first = 0
+            while first < min(len(text), len(old)) and text[first] == old[first]:
+                first += 1
+            same = 0
+            if total == sum(oldwidths):
+                # The characters after the change stay where they were
+                while same < min(len(text), len(old)) - first and \
+                        text[-1 - same] == old[-1 - same]:
+                    same += 1
+            last = len(text) - same
+            start = offset + sum(widths[:first])
+            stop = max(offset + sum(widths[:last]),
+                       self.offset + sum(oldwidths[:len(old) - same]))
+            if start < stop:
+                buffer.blit(frame.Frame(stop - start, sign.HEIGHT), start, 0)
+        if first < last:
+            buffer.blit(raster.render(text[first:last], self.color, sign.HEIGHT, self.font),
+                        offset + sum(widths[:first]), 0)
+
+        self.text, self.widths, self.offset = text, widths, offset
+        self.buffer, self.version = buffer, buffer.version
+        sign.currentMessage, sign.currentColor = text, self.color
+        sign.metrics.observe('render_seconds', time.time() - started)
+        return start, stop
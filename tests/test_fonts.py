@@ -0,0 +1,48 @@
+"""Glyph lookup: characters a font hasn't got are shown as '?', but ones it
+has with no width (control characters) take up no room.
+
+Run from the top of the repository with `python -m unittest discover tests`.
+"""
+import os
+import tempfile
+import unittest
+
+import fonts
+import raster
+
+
+class Fallback(unittest.TestCase):
+
+    def assertRendersAs(self, text, expected, font=None):
+        for render in filter(None, (raster.render_python, raster.numpy and raster.render_numpy)):
+            self.assertEqual(render([text], 1, font=font)[0].tolist(),
+                             render([expected], 1, font=font)[0].tolist())
+
+    def test_fontv_controls(self):
+        font = fonts.get()
+        for code in (9, 0x7f):
+            self.assertIn(code, font)
+            self.assertEqual(font.glyph(code), [''] * font.height)
+        self.assertRendersAs("a\tb\x7f", "ab")
+
+    def test_fontv_missing(self):
+        self.assertNotIn(0xe9, fonts.get())
+        self.assertRendersAs(u"caf\xe9", "caf?")
+
+    def test_binary_font(self):
+        fd, path = tempfile.mkstemp(suffix='.ldpf')
+        os.close(fd)
+        try:
+            # 'A', '?' and a tab with no width
+            fonts.write(path, 2, {0x41: (2, [3, 1]), 0x3f: (1, [1, 0]), 9: (0, [0, 0])})
+            font = fonts.BinaryFont(path, 'test-fallback')
+            self.assertEqual(font.glyph(9), ['', ''])
+            self.assertEqual(font.glyph(0x42), font.glyph(0x3f))
+            self.assertEqual(font.glyph(0x41), ['\1\1', '\0\1'])
+            font.map.close()
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
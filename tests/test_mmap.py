@@ -0,0 +1,72 @@
+"""The memory-mapped GPIO backend, mapped over a temporary file standing in
+for /dev/gpiomem.
+
+Run from the top of the repository with `python -m unittest discover tests`.
+"""
+import os
+import struct
+import tempfile
+import unittest
+
+import gpiobackend
+import ldp
+
+MMAP = gpiobackend.MmapBackend
+
+
+class UseMmap(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = ldp.backend, ldp.writer
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, '\0' * 4096)
+        os.close(fd)
+
+    def tearDown(self):
+        if ldp.backend is not self.saved[0]:
+            ldp.backend.cleanup()
+        ldp.backend, ldp.writer = self.saved
+        os.remove(self.path)
+
+    def word(self, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return struct.unpack('<I', f.read(4))[0]
+
+    def bits(self, *pins):
+        return sum(1 << MMAP.BOARD[pin] for pin in pins)
+
+    def test_missing(self):
+        self.assertFalse(ldp.usemmap(self.path + '.missing'))
+        self.assertIs(ldp.backend, self.saved[0])
+
+    def test_too_short(self):
+        with open(self.path, 'wb') as f:
+            f.write('\0' * 16)
+        self.assertFalse(ldp.usemmap(self.path))
+        self.assertIs(ldp.backend, self.saved[0])
+
+    def test_registers(self):
+        self.assertTrue(ldp.usemmap(self.path))
+        m = ldp.PINMAP
+        ldp.init()
+        # Every pin used is set up as an output (function 001)
+        for pin in m.pins():
+            bcm = MMAP.BOARD[pin]
+            fsel = self.word(MMAP.GPFSEL0 + bcm // 10 * 4) >> bcm % 10 * 3 & 7
+            self.assertEqual(fsel, 1, "pin {0} isn't an output".format(pin))
+        # init() ends by clearing, and the last thing written is a shift
+        # pulse (EN was already low): S falls, then rises
+        self.assertEqual(self.word(MMAP.GPSET0), self.bits(m.S))
+        self.assertEqual(self.word(MMAP.GPCLR0), self.bits(m.S))
+
+        # Red after off: R1 (active low) and S fall in one write, then S
+        # rises again to clock the pixel in
+        ldp.colourshift(1)
+        r1, g1 = m.lanes[0]
+        self.assertEqual(self.word(MMAP.GPCLR0), self.bits(r1, m.S))
+        self.assertEqual(self.word(MMAP.GPSET0), self.bits(m.S))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Timing of the refresh loop, measured on the simulated sign in simulated
+time: how long EN is high for each row against its brightness and shading,
+and how long a frame takes.
+
+Run from the top of the repository with `python -m unittest discover tests`.
+"""
+import time
+import unittest
+
+import frame
+import gpiobackend
+import ldp
+import scheduler
+import worker
+
+REFRESH = 100.0
+HEIGHT = 8
+SLOT = 1.0 / (REFRESH * HEIGHT)
+# Simulated time it takes to shift a row in (charged at the latch)
+SHIFT = 0.00025
+# Frames to run for; the first is left out of the measurements, while the
+# scheduler learns how long shifting takes
+FRAMES = 6
+
+
+class Clock(object):
+    """Simulated time, which only moves when the refresh loop sleeps or a
+    row is latched. Ends `refresher`'s loop after `FRAMES` frames."""
+
+    def __init__(self, refresher):
+        self.now = 0.0
+        self.refresher = refresher
+        self.started = None
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds == worker.RefreshWorker.IDLE:
+            # Blank while the first frame's command is on its way; give
+            # the queue's feeder thread a moment
+            time.sleep(0.001)
+        # (a hair over, so that the scheduler never spins on rounding)
+        self.now += seconds + 1e-12
+        if self.started is not None and self.now > self.started + FRAMES * HEIGHT * SLOT:
+            self.refresher.quit.value = 1
+
+    def latch(self, row):
+        if self.started is None:
+            self.started = self.now
+        self.now += SHIFT
+
+
+def run(buffer, brightness=1.0):
+    """Show `buffer` through the refresh loop on a simulated sign. Returns
+    the EN pulses for each row, as lists of `(start, length)`, and the
+    refresh worker."""
+    pinmap = ldp.PINMAP
+    refresher = worker.RefreshWorker(REFRESH)
+    clock = Clock(refresher)
+    refresher.clock, refresher.sleep = clock.clock, clock.sleep
+    sim = gpiobackend.SimulatedBackend(pinmap.simpins(), history=10 ** 6, clock=clock.clock)
+    sim.onlatch = clock.latch
+    channel = refresher.add(worker.Channel(buffer.width, buffer.height,
+                                           ldp.PinWriter(sim, pinmap)))
+    channel.brightness.value = brightness
+    channel.show(buffer)
+    refresher.run()
+
+    address, row, since, pulses = [0] * len(pinmap.address), None, None, {}
+    for stamp, pin, level in sim.transitions:
+        if pin in pinmap.address:
+            address[pinmap.address.index(pin)] = level
+        elif pin == pinmap.L and level:
+            row = ldp.ROWS.index(tuple(address))
+        elif pin == pinmap.EN:
+            if level:
+                since = stamp
+            elif since is not None:
+                if since >= clock.started + HEIGHT * SLOT:
+                    pulses.setdefault(row, []).append((since, stamp - since))
+                since = None
+    return pulses, refresher
+
+
+def filled(levels, width=80):
+    """Frame with row `i` lit red at brightness `levels[i]`."""
+    buffer = frame.Frame(width, HEIGHT)
+    for row, level in enumerate(levels):
+        for col in range(width):
+            buffer[row][col] = frame.shade(1, level)
+    return buffer
+
+
+class RefreshTiming(unittest.TestCase):
+
+    def setUp(self):
+        # Simulated sleeps land right on their deadlines
+        self.spin, scheduler.Scheduler.SPIN = scheduler.Scheduler.SPIN, 0.0
+
+    def tearDown(self):
+        scheduler.Scheduler.SPIN = self.spin
+
+    def assertPulses(self, pulses, length, period):
+        """Every pulse is `length` long, and they're `period` apart."""
+        self.assertTrue(len(pulses) >= FRAMES - 2)
+        for start, measured in pulses:
+            self.assertAlmostEqual(measured, length, delta=1e-9)
+        for (first, a), (second, b) in zip(pulses, pulses[1:]):
+            self.assertAlmostEqual(second - first, period, delta=1e-9)
+
+    def test_brightness(self):
+        buffer = filled([frame.LEVELS - 1] * HEIGHT)
+        for brightness in (0.3, 0.5, 1.0):
+            pulses, refresher = run(buffer, brightness)
+            self.assertEqual(sorted(pulses), range(HEIGHT))
+            for row in pulses:
+                # Lit for its share of what's left of the slot after
+                # shifting, and back a frame (`HEIGHT` slots) later
+                self.assertPulses(pulses[row], brightness * (SLOT - SHIFT), HEIGHT * SLOT)
+            self.assertEqual(refresher.metrics.get('missed_deadlines'), 0)
+
+    def test_bit_planes(self):
+        levels = (1, 2, 4, frame.LEVELS - 1)
+        pulses, refresher = run(filled(levels))
+        self.assertEqual(sorted(pulses), range(len(levels)))
+        for row, level in enumerate(levels):
+            # One pulse per frame: these levels light one bit-plane each
+            # (or the whole row, at full brightness). Blank rows are left
+            # out, so a frame takes a slot for each lit row.
+            self.assertPulses(pulses[row], (SLOT - SHIFT) * level / (frame.LEVELS - 1),
+                              len(levels) * SLOT)
+        self.assertEqual(refresher.metrics.get('missed_deadlines'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,38 +1,153 @@
-class Sign(object):
-    """Good for testing when the actual sign doesn't exist."""
-    RED = 1
-    GREEN = 2
-    ORANGE = 3
-    COLORNAMES = {1: 'red', 2: 'green', 3: 'orange', 4: 'blank'}
-
-    def __init__(self):
-        self.currentMessage = ""
-        self.displayProcess = False
-        self.currentColor = 4
+"""Simulated sign for running and load-testing the web app without one.
+
+`Sign` has the real `sign.Sign` API (it is one, on a simulated backend),
+with a software framebuffer for what's showing, but no display process.
+Instead, a `Timing` model stands in for what the hardware would cost: a
+render for every message not already cached, a delay to stop the display,
+and optionally the time the sign used to go blank while the old display
+process was joined on every change. The sign keeps count of the time it
+spends blank, and its metrics go up at the `refresh` rate while it's
+showing something.
+
+    >>> s = dummysign.Sign(timing=dummysign.Timing(render=0.005, join=0.2))
+    >>> s.staticPut("Hello"); s.static()
+    >>> s.blankSeconds()
+
+See `loadtest.py`.
+"""
+import threading
+import time
+
+from .. import gpiobackend
+from .. import ldp
+from .. import raster
+from .. import sign as ledsign
+from .. import worker
+
+
+class Timing(object):
+    """Costs, in seconds: `render` (plus `perchar` for each character) for
+    a message that isn't cached, `stop` to blank the display, `join` to end
+    a display process (0 with the long-lived display process; paid on every
+    change, with the sign blank, to model the old process-per-message
+    display) and `start` to start one. The display refreshes `refresh`
+    times a second."""
+
+    def __init__(self, render=0.002, perchar=0.0002, stop=0.001, join=0.0, start=0.0,
+                 refresh=100.0):
+        self.render, self.perchar = render, perchar
+        self.stop, self.join, self.start = stop, join, start
+        self.refresh = refresh
+
+
+class NullWorker(worker.RefreshWorker):
+    """Refresh worker that never starts a display process."""
 
-    def getColor(self):
-        return self.COLORNAMES[self.currentColor]
+    def start(self):
+        pass
 
-    def put(self, text, color=RED):
-        if len(text) > 13:
-            raise ledsign.SignDisplayError("Too big")
+
+class Sign(ledsign.Sign):
+    """A sign that exists only in memory. `shown` is what it's displaying
+    (a `frame.Frame`, or None when blank)."""
+
+    def __init__(self, width=80, height=8, timing=None, scrollspeed=20.0):
+        self.timing = timing or Timing()
+        pinmap = ldp.PINMAP.forwidth(width)
+        backend = gpiobackend.SimulatedBackend(pinmap.simpins(), width=pinmap.width,
+                                               lanes=pinmap.lanes)
+        ledsign.Sign.__init__(self, width, height, self.timing.refresh, scrollspeed,
+                              pinmap=pinmap, backend=backend,
+                              worker=NullWorker(self.timing.refresh))
+        # A display process of its own, as far as the metrics go
+        self.worker.metrics = self.metrics
+        # Calls that drive the display are made one at a time, as they
+        # would be on the hardware
+        self.lock = threading.RLock()
+        self.shown = None
+        self.blank = 0.0
+        self.since = time.time()
+        self.started = False
+
+    def _render(self, text, color, font=None):
+        key = (raster.decode(text), color, font or self.font, self.HEIGHT)
+        if key not in self.rendered:
+            time.sleep(self.timing.render + self.timing.perchar * len(key[0]))
+        return ledsign.Sign._render(self, text, color, font)
+
+    def _account(self, now):
+        """Bring the metrics up to `now`."""
+        elapsed = now - self.since
+        if self.shown is None:
+            self.blank += elapsed
+            self.metrics.inc('blank_seconds', elapsed)
         else:
-            self.currentMessage = text
-            self.currentColor = color
-            print "New message: {}".format(text)
+            frames = elapsed * self.timing.refresh
+            self.metrics.inc('frames', frames)
+            self.metrics.inc('rows', frames * self.HEIGHT)
+        self.since = now
+
+    def _display(self, shown, mode):
+        timing = self.timing
+        with self.lock:
+            if not self.started:
+                time.sleep(timing.start)
+                self.started = True
+            if timing.join:
+                self._account(time.time())
+                self.shown = None
+                time.sleep(timing.join)
+            self._account(time.time())
+            self.shown = shown
+            self.metrics.set('mode', mode)
+            self.displayProcess = True
 
-    def static(self):
-        print "Display on: static"
-        self.displayProcess = True
+    def _blank(self):
+        with self.lock:
+            time.sleep(self.timing.stop)
+            self._account(time.time())
+            self.shown = None
+            self.metrics.set('mode', worker.BLANK)
 
-    def scroll(self):
-        print "Display on: scroll"
-        self.displayProcess = True
+    def blankSeconds(self):
+        """Time spent blank so far."""
+        with self.lock:
+            self._account(time.time())
+            return self.blank
+
+    def static(self, interval=-1):
+        if self.buffer.isblank():
+            self._blank()
+            self.displayProcess = False
+            return
+        self.channel.flip(self.buffer.data)
+        self._display(self.buffer.copy(), worker.STATIC)
+
+    def scroll(self, interval=-1):
+        if not getattr(self, 'dotArray', None):
+            raise ledsign.SignDisplayError("Please put text on the sign using scrollPut.")
+        with self.channel.lock:
+            self.channel.scrolling = self.scroller
+            self.channel.offset.value = self.scroller.offset
+        self._display(self.scroller.strip.columns(self.scroller.offset,
+                                                  self.scroller.offset + self.WIDTH),
+                      worker.SCROLL)
 
     def stop(self):
-        print "Display off"
+        if not self.displayProcess:
+            raise Exception("There is no display loop running.")
+        self._blank()
         self.displayProcess = False
         self.currentMessage = ""
 
     def clear(self):
-        print "Clearing"
+        self._blank()
+
+    def shutdown(self):
+        with self.lock:
+            if self.started:
+                time.sleep(self.timing.join)
+                self.started = False
+        self._blank()
+        self.displayProcess = False
+        self.currentMessage = ""
@@ -0,0 +1,210 @@
+"""Load test for the web app, against a simulated sign (see dummysign.py).
+
+A number of client threads fire a mix of update, clear and home page
+requests at the app, through Flask's test client (or at a running server,
+given its URL), and the harness reports latency percentiles for each kind
+of request, the share of updates that were never displayed (superseded or
+failed), and the time the sign spent blank. Like web.py, it runs as a
+module of the package it's in:
+
+    $ python -m <package>.webapp.loadtest --clients 16 --requests 200
+    $ python -m <package>.webapp.loadtest --join 0.2 --max-p99 0.05
+
+With `--max-p99` and/or `--max-rejected` it exits with status 1 if the run
+does worse, so it can be used as a regression gate.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib
+import urllib2
+
+from . import dummysign
+from . import web
+
+MESSAGES = ["Hello", "Back in 5", "Meeting in room 2", "Welcome",
+            "The quick brown fox jumps over the lazy dog", "Lunch", "Closed"]
+
+
+def percentile(values, p):
+    """The `p`th percentile of `values` (nearest rank), or None."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))]
+
+
+class Client(object):
+    """Makes requests through Flask's test client, or to `url` if given.
+    Returns `(status code, JSON body or None)`."""
+
+    def __init__(self, url=None):
+        self.url = url.rstrip('/') if url else None
+        self.client = None if url else web.app.test_client()
+
+    def request(self, method, path, form=None):
+        headers = {'Accept': 'application/json'}
+        if self.client:
+            response = self.client.open(path, method=method, data=form, headers=headers)
+            status, body = response.status_code, response.get_data()
+        else:
+            data = urllib.urlencode(form) if form else None
+            req = urllib2.Request(self.url + path, data, headers)
+            req.get_method = lambda: method
+            try:
+                response = urllib2.urlopen(req)
+                status, body = response.getcode(), response.read()
+            except urllib2.HTTPError as e:
+                status, body = e.code, e.read()
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+
+class LoadTest(object):
+    """`clients` threads making `requests` requests each, in the proportions
+    given by `mix` (request kind: weight), `think` seconds apart on
+    average."""
+
+    MIX = {'update': 6, 'home': 3, 'clear': 1}
+
+    def __init__(self, clients=8, requests=100, mix=None, think=0.0, url=None):
+        self.clients, self.requests = clients, requests
+        self.mix = mix or self.MIX
+        self.think = think
+        self.url = url
+        self.latencies = dict((kind, []) for kind in self.mix)
+        self.errors = 0
+        self.updates = []  # request ids of accepted updates
+        self.lock = threading.Lock()
+
+    def _choose(self, rng):
+        pick = rng.uniform(0, sum(self.mix.values()))
+        for kind, weight in sorted(self.mix.items()):
+            pick -= weight
+            if pick <= 0:
+                return kind
+        return kind
+
+    def _client(self, seed):
+        rng = random.Random(seed)
+        client = Client(self.url)
+        for n in xrange(self.requests):
+            kind = self._choose(rng)
+            started = time.time()
+            if kind == 'update':
+                form = {'msg': rng.choice(MESSAGES), 'color': str(rng.randint(1, 3))}
+                if rng.random() < 0.3:
+                    form['scroll'] = 'Scroll'
+                status, body = client.request('POST', '/update', form)
+            elif kind == 'clear':
+                status, body = client.request('GET', '/clear')
+            else:
+                status, body = client.request('GET', '/')
+            elapsed = time.time() - started
+            with self.lock:
+                self.latencies[kind].append(elapsed)
+                if status != 200:
+                    self.errors += 1
+                elif kind == 'update' and body:
+                    self.updates.append(body['id'])
+            if self.think:
+                time.sleep(rng.expovariate(1.0 / self.think))
+
+    def run(self):
+        """Run the test; returns a report dict."""
+        sign = web.app.config['sign']
+        blank = sign.blankSeconds() if hasattr(sign, 'blankSeconds') else None
+        started = time.time()
+        threads = [threading.Thread(target=self._client, args=(seed,))
+                   for seed in range(self.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+        statuses = self._settle()
+
+        report = {'seconds': elapsed, 'errors': self.errors,
+                  'requests': sum(len(values) for values in self.latencies.values())}
+        report['throughput'] = report['requests'] / elapsed
+        for kind, values in sorted(self.latencies.items()):
+            report[kind] = {'count': len(values), 'p50': percentile(values, 50),
+                            'p99': percentile(values, 99)}
+        every = [value for values in self.latencies.values() for value in values]
+        report['p50'], report['p99'] = percentile(every, 50), percentile(every, 99)
+        rejected = sum(1 for status in statuses if status in ('superseded', 'failed', None))
+        report['updates'] = len(statuses)
+        report['rejected_rate'] = float(rejected) / len(statuses) if statuses else 0.0
+        if blank is not None:
+            report['blank_seconds'] = sign.blankSeconds() - blank
+        return report
+
+    def _settle(self, timeout=10.0):
+        """Final statuses of the accepted updates, once none are queued."""
+        client = Client(self.url)
+        deadline = time.time() + timeout
+        statuses = {}
+        for rid in self.updates:
+            while True:
+                status, body = client.request('GET', '/update/{0}'.format(rid))
+                statuses[rid] = body and body.get('status')
+                if statuses[rid] != 'queued' or time.time() > deadline:
+                    break
+                time.sleep(0.01)
+        return statuses.values()
+
+
+def format_report(report):
+    ms = lambda value: '-' if value is None else '{0:.1f}'.format(value * 1000)
+    lines = ['{0} requests in {1:.1f}s ({2:.0f}/s), {3} errors'.format(
+        report['requests'], report['seconds'], report['throughput'], report['errors']),
+        '{0:<10} {1:>7} {2:>9} {3:>9}'.format('request', 'count', 'p50 (ms)', 'p99 (ms)')]
+    for kind in ('update', 'home', 'clear'):
+        if kind in report:
+            r = report[kind]
+            lines.append('{0:<10} {1:>7} {2:>9} {3:>9}'.format(kind, r['count'], ms(r['p50']),
+                                                                ms(r['p99'])))
+    lines.append('{0:<10} {1:>7} {2:>9} {3:>9}'.format('all', report['requests'],
+                                                        ms(report['p50']), ms(report['p99'])))
+    lines.append('updates rejected: {0:.1%} of {1}'.format(report['rejected_rate'],
+                                                          report['updates']))
+    if 'blank_seconds' in report:
+        lines.append('time blank: {0:.2f}s'.format(report['blank_seconds']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the sign web app.")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help="per client")
+    parser.add_argument('--think', type=float, default=0.0,
+                        help="mean seconds between a client's requests")
+    parser.add_argument('--url', help="test a running server instead of the app in-process")
+    parser.add_argument('--render', type=float, default=0.002, help="simulated render cost")
+    parser.add_argument('--stop', type=float, default=0.001, help="simulated stop cost")
+    parser.add_argument('--join', type=float, default=0.0,
+                        help="simulated display process join on every change")
+    parser.add_argument('--max-p99', type=float, help="fail if p99 latency exceeds this")
+    parser.add_argument('--max-rejected', type=float,
+                        help="fail if more than this fraction of updates are rejected")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if not args.url:
+        timing = dummysign.Timing(render=args.render, stop=args.stop, join=args.join)
+        web.serve({'main': dummysign.Sign(timing=timing)})
+    report = LoadTest(args.clients, args.requests, think=args.think, url=args.url).run()
+    print json.dumps(report, indent=2, sort_keys=True) if args.json else format_report(report)
+
+    failed = (args.max_p99 is not None and report['p99'] > args.max_p99) or \
+        (args.max_rejected is not None and report['rejected_rate'] > args.max_rejected)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Background queue of sign updates for the web app.
+
+Request handlers `submit` an update and return straight away; a single
+worker thread applies them to the sign in order. When updates arrive faster
+than they can be applied, only the newest one is displayed and the ones it
+replaced are marked superseded, since they would only have flashed up for
+an instant anyway.
+
+    >>> updates = updater.Updater(sign)
+    >>> rid = updates.submit('update', msg="Hello", color=1, mode='static')
+    >>> updates.status(rid)
+    'queued'
+
+"""
+import itertools
+import threading
+from collections import deque
+
+from .. import lru
+
+QUEUED = 'queued'
+APPLIED = 'applied'
+SUPERSEDED = 'superseded'
+FAILED = 'failed'
+
+
+class Updater(object):
+    """Applies queued commands to `sign` from a background thread.
+
+    Commands are 'update' (with `msg`, `color`, `mode`, which is 'static'
+    or 'scroll', and optionally `font`) and 'clear'. At most `maxsize` commands wait at once; if
+    more arrive, the oldest waiting one is superseded. The statuses of the
+    last `history` requests are kept for `status`.
+    """
+
+    def __init__(self, sign, maxsize=16, history=1024):
+        self.sign = sign
+        self.pending = deque(maxlen=maxsize)
+        self.statuses = lru.LRUCache(history)
+        self.ids = itertools.count(1)
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, command, **args):
+        """Queue `command` and return its request id."""
+        with self.cond:
+            rid = next(self.ids)
+            if len(self.pending) == self.pending.maxlen:
+                self.statuses.put(self.pending[0][0], SUPERSEDED)
+            self.pending.append((rid, command, args))
+            self.statuses.put(rid, QUEUED)
+            self.cond.notify()
+        return rid
+
+    def status(self, rid):
+        """Status of request `rid` (None if it's unknown or too old)."""
+        with self.cond:
+            return self.statuses.get(rid)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                # Latest wins: everything but the newest command is skipped
+                batch = list(self.pending)
+                self.pending.clear()
+                for rid, command, args in batch[:-1]:
+                    self.statuses.put(rid, SUPERSEDED)
+            rid, command, args = batch[-1]
+            try:
+                getattr(self, 'do_' + command)(**args)
+                status = APPLIED
+            except Exception:
+                status = FAILED
+            with self.cond:
+                self.statuses.put(rid, status)
+
+    def do_update(self, msg, color, mode='static', font=None):
+        sign = self.sign
+        if mode == 'static':
+            try:
+                sign.staticPut(msg, color, font=font)
+                sign.static()
+                return
+            except ValueError:
+                # Too long, so we'll scroll it instead.
+                pass
+        msg += " "*3
+        sign.scrollPut(msg, color, font=font)
+        sign.scroll()
+
+    def do_clear(self):
+        sign = self.sign
+        if sign.displayProcess:
+            sign.stop()
+        else:
+            sign.clear()
@@ -1,77 +1,242 @@
-from flask import Flask, render_template, request, Response, url_for
+from flask import Flask, render_template, request, Response, url_for, jsonify, abort
+from .. import fonts
+from .. import metrics as ledmetrics
+from .. import playlist
+from .. import preview
 from .. import sign as ledsign
-# or: import dummysign as ledsign
+# or: from . import dummysign as ledsign
+from .updater import Updater
 
 app = Flask(__name__)
 app.debug = True
 app.config.update(
     {'sign': ledsign.Sign(),
-    'updateLock': False,
-    'lockErr': "Oops! Someone else is updating the sign."
     }
 )
+# Updates are applied in the background, newest first (see updater.py)
+app.config['updates'] = Updater(app.config['sign'])
+# Every sign is served at /sign/<id>; the routes without an id use 'main'
+app.config['signs'] = {'main': app.config['sign']}
+app.config['updaters'] = {'main': app.config['updates']}
+# Live preview (see preview.py): samples a second, viewers per sign, frames
+# a viewer can fall behind by, and frames between keyframes
+app.config['preview'] = {'fps': 10.0, 'maxsubscribers': 100, 'backlog': 8, 'keyframe': 50}
+app.config['previews'] = {}
+# Seconds between keepalives on an idle preview stream
+KEEPALIVE = 15
+# Playlists by name (see playlist.py), and the player on each sign
+app.config['playlists'] = {}
+app.config['players'] = {}
 
-@app.route("/")
-def home():
-    msg = app.config['sign'].currentMessage
-    return render_template("sign.html", msg=msg)
+def serve(signs, default=None):
+    """Serve each of `signs` (id: Sign pairs, e.g. a manager.SignManager)
+    at /sign/<id>, with the routes without an id going to `default` (the
+    first sign if None)."""
+    signs = list(signs.items())
+    default = default if default is not None else signs[0][0]
+    app.config['signs'] = dict(signs)
+    app.config['updaters'] = dict((sid, Updater(sign)) for sid, sign in signs)
+    app.config['sign'] = app.config['signs'][default]
+    app.config['updates'] = app.config['updaters'][default]
 
-@app.route("/update", methods=["POST"])
-def updateSign():
+def lookup(sid):
+    """The sign and updater for `sid` (the default sign if None)."""
+    if sid is None:
+        return app.config['sign'], app.config['updates']
+    if sid not in app.config['signs']:
+        abort(404)
+    return app.config['signs'][sid], app.config['updaters'][sid]
+
+def page(sid, **args):
+    sign, updates = lookup(sid)
+    return render_template("sign.html", sign=sign, sid=sid,
+                           signs=sorted(app.config['signs']), fonts=fonts.names(), **args)
+
+def broadcaster(sid):
+    """The preview broadcaster for `sid`, shared by all its viewers."""
+    sign = lookup(sid)[0]
+    previews = app.config['previews']
+    if sign not in previews:
+        previews[sign] = preview.Broadcaster(sign, **app.config['preview'])
+    return previews[sign]
+
+def stopPlaylist(sid):
+    """Stop any playlist playing on `sid`, so that it can be updated."""
+    player = app.config['players'].pop(lookup(sid)[0], None)
+    if player:
+        player.stop()
+
+def wantsJSON():
+    return request.args.get('format') == 'json' or \
+        request.accept_mimetypes.best == 'application/json'
+
+def queued(sid, rid, msg=None, err=None):
+    """Response for a request that has been queued as `rid`."""
+    status = lookup(sid)[1].status(rid)
+    if wantsJSON():
+        return jsonify(id=rid, status=status)
+    return page(sid, msg=msg, err=err, rid=rid, status=status)
+
+@app.route("/", defaults={'sid': None})
+@app.route("/sign/<sid>")
+def home(sid):
+    msg = lookup(sid)[0].currentMessage
+    return page(sid, msg=msg)
+
+@app.route("/update", methods=["POST"], defaults={'sid': None})
+@app.route("/sign/<sid>/update", methods=["POST"])
+def updateSign(sid):
     msg = request.form.get('msg')
     color = int(request.form.get('color'))
-    sign = app.config['sign']
-
-    if msg and not app.config['updateLock']:
-        app.config['updateLock'] = True # take lock so we don't get conflicts
-        msg = msg.encode('ascii', 'ignore')
-        
-        # There is already a message up, so clear it first
-        if sign.displayProcess: 
-            sign.stop()
-
-        # Try and update bitmap
-        if request.form.get('static'):
-            try:
-                # Put bitmap to buffer
-                sign.staticPut(msg, color)
-                sign.static()
-            except ValueError:
-                # Too long, so we'll scroll it instead.
-                msg += " "*3
-                sign.scrollPut(msg, color)
-                sign.scroll()
-            finally:
-                # Either way, we release the lock and update the page.
-                app.config['updateLock'] = False # release lock
-                return render_template("sign.html", msg=msg)
-
-        # Scrolling is also an option
-        elif request.form.get('scroll'):
-            msg += " "*3
-            sign.scrollPut(msg, color)
-            sign.scroll()
-            app.config['updateLock'] = False # release lock
-            return render_template("sign.html", msg=msg)
-        
-    elif app.config['updateLock']:
-        # Can't acquire lock
-        return render_template("sign.html", err=app.config['lockErr'])
-        
-@app.route("/clear")
-def clear():
-    sign = app.config['sign']
-    if not app.config['updateLock']:
-        app.config['updateLock'] = True
-        
-        if sign.displayProcess: 
-            sign.stop()
-        else:
-            sign.clear()        
-        app.config['updateLock'] = False
-        return render_template("sign.html", err="Sign cleared.")
+    font = request.form.get('font') or None
+
+    if font is not None and font not in fonts.names():
+        return page(sid, err="Unknown font.")
+    if msg:
+        stopPlaylist(sid)
+        # Static text that's too long gets scrolled instead
+        mode = 'scroll' if request.form.get('scroll') else 'static'
+        rid = lookup(sid)[1].submit('update', msg=msg, color=color, mode=mode, font=font)
+        return queued(sid, rid, msg=msg)
+    return page(sid, err="Please enter a message.")
+
+@app.route("/update/<int:rid>", defaults={'sid': None})
+@app.route("/sign/<sid>/update/<int:rid>")
+def updateStatus(sid, rid):
+    """Status of an earlier update: queued, applied, superseded or failed."""
+    return jsonify(id=rid, status=lookup(sid)[1].status(rid))
+
+@app.route("/metrics", defaults={'sid': None})
+@app.route("/sign/<sid>/metrics")
+def metrics(sid):
+    """Display process counters and histograms, for Prometheus, labelled
+    with the sign's id. /metrics has every sign. Signs sharing a display
+    process (a manager.SignManager) each repeat its figures, like missed
+    deadlines and row jitter, alongside their own."""
+    if sid is None:
+        signs = sorted(app.config['signs'].items())
     else:
-        return render_template("sign.html", err=app.config['lockErr'])
-        
+        signs = [(sid, lookup(sid)[0])]
+    series = []
+    for name, sign in signs:
+        values = sign.metrics.snapshot()
+        shared = sign.worker.metrics
+        if shared is not sign.metrics:
+            process = shared.snapshot()
+            values.update((key, process[key]) for key in ledmetrics.PROCESS)
+        series.append(({'sign': name}, values))
+    return Response(ledmetrics.prometheus(series),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route("/brightness", methods=["POST"], defaults={'sid': None})
+@app.route("/sign/<sid>/brightness", methods=["POST"])
+def brightness(sid):
+    """Set the sign's brightness, as a percentage. Takes effect straight
+    away, without going through the update queue."""
+    sign = lookup(sid)[0]
+    try:
+        percent = float(request.form.get('brightness'))
+    except (TypeError, ValueError):
+        return page(sid, err="Brightness must be a number from 0 to 100.")
+    sign.brightness = max(0.0, min(percent, 100.0)) / 100
+    if wantsJSON():
+        return jsonify(brightness=sign.brightness)
+    return page(sid, msg=sign.currentMessage)
+
+@app.route("/preview", defaults={'sid': None})
+@app.route("/sign/<sid>/preview")
+def previewStream(sid):
+    """What the sign is showing, as a stream of Server-Sent Events (see
+    preview.py). Needs a threaded or async server."""
+    try:
+        viewer = broadcaster(sid).subscribe()
+    except RuntimeError as e:
+        return Response(str(e), status=503, mimetype='text/plain')
+
+    def events():
+        try:
+            while True:
+                frames = viewer.get(KEEPALIVE)
+                if not frames:
+                    yield ": keepalive\n\n"
+                for seq, line in frames:
+                    yield "id: {0}\ndata: {1}\n\n".format(seq, line)
+        finally:
+            viewer.close()
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route("/clear", defaults={'sid': None})
+@app.route("/sign/<sid>/clear")
+def clear(sid):
+    stopPlaylist(sid)
+    rid = lookup(sid)[1].submit('clear')
+    return queued(sid, rid, err="Sign cleared.")
+
+def playlistJSON():
+    """The playlist in the request body, or a 400 response."""
+    try:
+        return playlist.Playlist.fromdict(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        abort(Response(str(e), status=400, mimetype='text/plain'))
+
+def findPlaylist(name):
+    if name not in app.config['playlists']:
+        abort(404)
+    return app.config['playlists'][name]
+
+@app.route("/playlists")
+def listPlaylists():
+    return jsonify(playlists=[p.todict() for name, p in sorted(app.config['playlists'].items())])
+
+@app.route("/playlists", methods=["POST"])
+def createPlaylist():
+    new = playlistJSON()
+    if new.name in app.config['playlists']:
+        return Response("There's already a playlist called {0}.".format(new.name),
+                        status=409, mimetype='text/plain')
+    app.config['playlists'][new.name] = new
+    return jsonify(new.todict()), 201
+
+@app.route("/playlists/<name>")
+def getPlaylist(name):
+    return jsonify(findPlaylist(name).todict())
+
+@app.route("/playlists/<name>", methods=["PUT"])
+def replacePlaylist(name):
+    """Replace a playlist's items. Signs playing it pick up the change from
+    their next item."""
+    old, new = findPlaylist(name), playlistJSON()
+    if new.name != name:
+        abort(Response("Playlist name doesn't match the URL.", status=400, mimetype='text/plain'))
+    old.items, old.loop = new.items, new.loop
+    return jsonify(old.todict())
+
+@app.route("/playlists/<name>", methods=["DELETE"])
+def deletePlaylist(name):
+    """Delete a playlist, stopping it wherever it's playing."""
+    old = findPlaylist(name)
+    for sign, player in list(app.config['players'].items()):
+        if player.playlist is old:
+            del app.config['players'][sign]
+            player.stop()
+    del app.config['playlists'][name]
+    return ('', 204)
+
+@app.route("/playlists/<name>/play", methods=["POST"], defaults={'sid': None})
+@app.route("/sign/<sid>/playlists/<name>/play", methods=["POST"])
+def playPlaylist(sid, name):
+    """Play a playlist on the sign, replacing whatever it was showing."""
+    p = findPlaylist(name)
+    sign = lookup(sid)[0]
+    stopPlaylist(sid)
+    player = app.config['players'][sign] = playlist.Player(sign, p)
+    player.start()
+    return jsonify(playing=name)
 
-        
+@app.route("/playlists/stop", methods=["POST"], defaults={'sid': None})
+@app.route("/sign/<sid>/playlists/stop", methods=["POST"])
+def stopPlaying(sid):
+    """Stop the sign's playlist, leaving its current item showing."""
+    stopPlaylist(sid)
+    return jsonify(playing=None)
@@ -0,0 +1,445 @@
+"""Long-lived display process with double-buffered frames in shared memory.
+
+Instead of starting a new process for every message (and blanking the sign
+while the old one is joined), signs are refreshed by a `RefreshWorker` that
+keeps running. Each sign it drives has a `Channel`: static frames are
+written to whichever of the channel's two shared frame buffers the worker
+isn't showing, and then flipped in; the worker notices the flip at the end
+of the frame it's on and carries on refreshing with the new content.
+Everything else (switching to scrolling, playing an animation, blanking
+the sign) is a command sent over the channel's queue.
+
+    >>> w = worker.RefreshWorker()
+    >>> c = w.add(worker.Channel(80, 8, ldp.writer))
+    >>> w.start()
+    >>> c.show(s.buffer)   # display a frame
+    >>> c.scroll(s.scroller)
+    >>> c.animate(logo)    # an animation.Animation
+    >>> c.blank()
+    >>> w.shutdown()
+
+One worker can drive several signs (see `manager.SignManager`). Their rows
+are interleaved: every sign that's showing something keeps its own place
+on the worker's grid of row slots (see `scheduler.Track`), and whenever a
+sign's deadline comes round it shifts in and lights its next step (a row,
+or one of a shaded row's bit-planes; see `frameprog`), so they all refresh
+at the same rate from a single process.
+
+A channel's `brightness` (0 to 1) dims its sign as a whole: each step is
+lit for only that share of its time, and the display is off for the rest.
+"""
+import ctypes
+import threading
+import time
+from multiprocessing import Process, Queue
+from multiprocessing.sharedctypes import RawArray, RawValue
+from Queue import Empty
+from timeit import default_timer
+
+import frame
+import frameprog
+import ldp
+import lru
+import scheduler
+from metrics import Metrics, Sampler
+
+# Display modes
+BLANK = 0
+STATIC = 1
+SCROLL = 2
+ANIMATE = 3
+
+
+class Channel(object):
+    """One `width` x `height` sign's share of a `RefreshWorker`: its frame
+    buffers and command queue, and the display state the worker keeps for
+    it. Pins are driven through `writer` (an `ldp.PinWriter`; `ldp.writer`
+    if None), text scrolls at `scrollspeed` columns a second, and `metrics`
+    (a `metrics.Metrics`, shared with the parent) gets the sign's frame
+    counts. `brightness` is a shared value from 0 (off) to 1 (full).
+
+    `generation` counts the frames flipped in so far; the front buffer is
+    `frames[generation % 2]`. `seen` is the last generation the worker has
+    picked up, and the back buffer is only written once the worker has
+    caught up, so it's never overwritten while being read.
+    """
+
+    # How many animations' compiled frames the display process keeps
+    ANIMATIONS = 8
+
+    def __init__(self, width, height, writer=None, scrollspeed=20.0, metrics=None):
+        self.width, self.height = width, height
+        self.writer = writer
+        self.scrollspeed = scrollspeed
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.frames = [RawArray('B', width * height), RawArray('B', width * height)]
+        self.generation = RawValue('L', 0)
+        self.seen = RawValue('L', 0)
+        self.commands = Queue()
+        self.sent = RawValue('L', 0)
+        self.brightness = RawValue('d', 1.0)
+        # Where the display process is in the scroll or animation last
+        # sent: the scroll offset or frame number (see `peek`)
+        self.scrolling = self.animating = None
+        self.offset = RawValue('l', 0)
+        self.lock = threading.Lock()  # serialises producers in this process
+        self.worker = None  # the RefreshWorker it's been added to
+
+    ###### Producer side ######
+
+    def command(self, name, *args):
+        """Queue a command for the display process."""
+        with self.lock:
+            self.commands.put((name,) + args)
+            self.sent.value += 1
+
+    def flip(self, data, timeout=1.0):
+        """Write the pixel bytes `data` to the back buffer and make it the
+        front one. Waits (up to `timeout` seconds) for the display process
+        to pick up the previous flip first. Raises ValueError if `data`
+        isn't `width` x `height` pixels."""
+        if len(data) != self.width * self.height:
+            raise ValueError("expected {0} bytes of pixel data, got {1}".format(
+                self.width * self.height, len(data)))
+        with self.lock:
+            deadline = time.time() + timeout
+            while self.seen.value != self.generation.value and \
+                    self.worker and self.worker.running():
+                if time.time() > deadline:
+                    break
+                time.sleep(0.0005)
+            back = (self.generation.value + 1) % 2
+            ctypes.memmove(self.frames[back], str(data), len(self.frames[back]))
+            self.generation.value += 1
+
+    def show(self, buffer):
+        """Display the `frame.Frame` `buffer` until told otherwise."""
+        self.flip(buffer.data)
+        self.command('static')
+
+    def scroll(self, scroller):
+        """Scroll the message prepared in the `scroller.Scroller`."""
+        with self.lock:
+            self.scrolling = scroller
+            self.offset.value = scroller.offset
+        self.command('scroll', scroller)
+
+    def animate(self, animation):
+        """Play the `animation.Animation`. Each frame is compiled the first
+        time it's shown, and the compiled frames are kept for next time."""
+        with self.lock:
+            self.animating = animation
+            self.offset.value = 0
+        self.command('animate', animation)
+
+    def blank(self):
+        """Clear the sign and stop refreshing it (the process stays up)."""
+        self.command('blank')
+
+    def peek(self):
+        """What the sign is showing, as a `frame.Frame`, for previews.
+        Only reads shared memory, so it never holds up the display process
+        (and, being a snapshot, can be a frame behind)."""
+        mode = self.metrics.get('mode')
+        if mode == SCROLL and self.scrolling is not None:
+            scroller = self.scrolling
+            offset = self.offset.value
+            return scroller.strip.columns(offset, offset + scroller.width)
+        if mode == ANIMATE and self.animating is not None:
+            return self.animating.frame(self.offset.value % len(self.animating))
+        if mode == STATIC:
+            while True:
+                generation = self.generation.value
+                data = bytearray(self.frames[generation % 2])
+                if self.generation.value == generation:
+                    return frame.Frame(self.width, self.height, data)
+        return frame.Frame(self.width, self.height)
+
+    ###### Display process ######
+
+    def front(self):
+        """Copy of the front buffer as a `frame.Frame`."""
+        generation = self.generation.value
+        data = bytearray(self.frames[generation % 2])
+        self.seen.value = generation
+        return frame.Frame(self.width, self.height, data)
+
+    def begin(self, clock):
+        """Set up the display state; called when the display process starts."""
+        if self.writer is None:
+            self.writer = ldp.writer
+        self.mode, self.program, self.scroller = BLANK, None, None
+        self.animation = None
+        # Compiled frames of recent animations, by key
+        self.compiled = lru.LRUCache(self.ANIMATIONS)
+        self.received = 0
+        self.scan = None
+        self.due = None  # deadline of the step being shown
+        self.track = scheduler.Track()
+        # Only used for its scroll speed; the worker paces the rows
+        self.pace = scheduler.Scheduler(self.height, None, self.scrollspeed, clock)
+        self.fps = (clock(), 0)
+
+    def poll(self):
+        """Pick up commands and flipped frames. Only called between frames,
+        so a change always lands at a frame boundary."""
+        m = self.metrics
+        if self.sent.value != self.received:
+            try:
+                while True:
+                    cmd = self.commands.get_nowait()
+                    self.received += 1
+                    m.inc('commands')
+                    if self.mode == BLANK:
+                        # Don't count the time blank as scrolling time
+                        self.pace.reset()
+                    if cmd[0] == 'static':
+                        self.mode = STATIC
+                    elif cmd[0] == 'scroll':
+                        self.mode, self.scroller = SCROLL, cmd[1]
+                    elif cmd[0] == 'animate':
+                        self._animate(cmd[1])
+                    elif cmd[0] == 'blank':
+                        self.mode = BLANK
+                        self.writer.clear()
+                    m.set('mode', self.mode)
+            except Empty:
+                pass
+
+        generation = self.generation.value
+        if self.seen.value != generation:
+            m.inc('flips', generation - self.seen.value)
+            if self.mode == STATIC and self.program:
+                # Only the rows that changed get recompiled
+                self.program.update(self.front())
+            elif self.mode == STATIC:
+                self.program = self._compile()
+            else:
+                # Not showing frames right now; let producers carry on
+                # flipping and compile the latest one when we are.
+                self.seen.value = generation
+                self.program = None
+
+    def _compile(self):
+        return frameprog.compile(self.front(), self.width, self.height, self.writer.map)
+
+    def _animate(self, animation):
+        self.mode, self.animation = ANIMATE, animation
+        self.programs = self.compiled.get(animation.key)
+        if self.programs is None:
+            self.programs = [None] * len(animation)
+            self.compiled.put(animation.key, self.programs)
+        self.index, self.loop, self.until = 0, 0, None
+
+    def _animationframe(self, clock):
+        """Frame program for the animation frame due now."""
+        index = self.index
+        if self.programs[index] is None:
+            a = self.animation
+            self.programs[index] = frameprog.compile(a.frame(index), self.width, self.height,
+                                                     self.writer.map)
+            self.metrics.inc('animation_compiles')
+        if self.until is None:
+            self.until = clock() + self.animation.delays[index]
+        return self.programs[index]
+
+    def _advance(self, now):
+        """Move on to the next animation frame if this one's time is up."""
+        a = self.animation
+        if now < self.until:
+            return
+        if self.index + 1 == len(a):
+            if a.loops and self.loop + 1 >= a.loops:
+                # Played out; stay on the last frame
+                self.until = float('inf')
+                return
+            self.loop += 1
+        self.index = (self.index + 1) % len(a)
+        self.until += a.delays[self.index]
+        if self.until < now:
+            # Fell behind (e.g. a frame shorter than a refresh); don't
+            # race through frames to catch up
+            self.until = now + a.delays[self.index]
+        self.offset.value = self.index
+
+    def _dim(self, scan):
+        """`scan`, with each step lit for `brightness` of its weight and
+        the display off for the rest of it."""
+        writer, EN = self.writer, self.writer.map.EN
+        dimmed = False
+        for weight in scan:
+            brightness = self.brightness.value
+            if brightness >= 1.0:
+                yield weight
+                continue
+            dimmed = True
+            if brightness > 0.0:
+                yield weight * brightness
+            # The scan's calls don't go through the writer, so its cached
+            # level for EN can't be trusted; write it regardless
+            writer.level.pop(EN, None)
+            writer.set(EN, 0)
+            yield weight * (1.0 - max(brightness, 0.0))
+        if dimmed:
+            # The scan's idea of where EN was left no longer holds
+            writer.level.pop(EN, None)
+
+    def row(self, clock):
+        """Shift in and light the sign's next step (see `frameprog`),
+        starting a new frame (and finishing the last one) as needed.
+        Returns the step's weight, or 0 if the sign is blank."""
+        if self.scan is None:
+            self.poll()
+            if self.mode == BLANK:
+                return 0
+            if self.mode == STATIC:
+                if self.program is None:
+                    self.program = self._compile()
+                self.scan = self._dim(self.program.scan(self.writer))
+            elif self.mode == ANIMATE:
+                self.scan = self._dim(self._animationframe(clock).scan(self.writer))
+            else:
+                self.scan = self._dim(self.scroller.scan(self.writer))
+            self.started = clock()
+        try:
+            return next(self.scan)
+        except StopIteration:
+            self._frame(clock)
+            return self.row(clock)
+
+    def _frame(self, clock):
+        """Finish the frame just shown and record it in the metrics."""
+        m = self.metrics
+        self.writer.endframe()
+        if self.mode == SCROLL:
+            self.scroller.step(self.pace.columns())
+            self.offset.value = self.scroller.offset
+        self.scan = None
+        now = clock()
+        if self.mode == ANIMATE:
+            self._advance(now)
+        calls, writes = self.writer.lastframe
+        m.inc('frames')
+        m.inc('rows', self.height)
+        m.inc('pin_calls', calls)
+        m.inc('pin_writes', writes)
+        m.observe('frame_seconds', now - self.started)
+        second, frames = self.fps
+        frames += 1
+        if now - second >= 1.0:
+            m.set('fps', frames / (now - second))
+            second, frames = now, 0
+        self.fps = (second, frames)
+
+
+class RefreshWorker(object):
+    """Display process for the signs whose `Channel`s are added to it,
+    refreshed `refresh` times a second (see `scheduler.Scheduler`). The
+    refresh loop keeps `metrics` (a `metrics.Metrics`, shared with the
+    parent) up to date with the figures that cover all the signs: missed
+    deadlines, stalls, row jitter and time spent blank. Its profiler is
+    turned on and off through `metrics.profiling`. If `realtime` (a
+    `realtime.Realtime`) is given, the display process applies it before
+    it starts refreshing. `clock` and `sleep` are what the refresh loop
+    keeps time with (see `scheduler.Scheduler`).
+    """
+
+    # How long to wait between checks while every sign is blank (seconds)
+    IDLE = 0.01
+
+    def __init__(self, refresh=100.0, metrics=None, realtime=None,
+                 clock=default_timer, sleep=time.sleep):
+        self.refresh = refresh
+        self.clock, self.sleep = clock, sleep
+        self.realtime = realtime
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.channels = []
+        self.quit = RawValue('b', 0)
+        self.process = None
+
+    def running(self):
+        return bool(self.process and self.process.is_alive())
+
+    def add(self, channel):
+        """Add `channel` to the signs refreshed, and return it. Channels
+        can't be added once the display process is running."""
+        if self.running():
+            raise RuntimeError("Can't add a sign while the display process is running.")
+        channel.worker = self
+        self.channels.append(channel)
+        return channel
+
+    def start(self):
+        """Start the display process, if it isn't already running."""
+        if not self.running():
+            self.quit.value = 0
+            self.process = Process(target=self.run)
+            self.process.daemon = True
+            self.process.start()
+
+    def shutdown(self):
+        """Blank the signs and end the display process."""
+        if self.running():
+            self.quit.value = 1
+            self.process.join()
+        self.process = None
+
+    def run(self):
+        """Refresh loop; runs in the display process."""
+        m = self.metrics
+        height = max(channel.height for channel in self.channels)
+        sched = scheduler.Scheduler(height, self.refresh, None, self.clock, self.sleep,
+                                    metrics=m)
+        clock = sched.clock
+        if self.realtime:
+            self.realtime.apply(m)
+            sched.stall = self.realtime.stall
+        else:
+            m.set('realtime_cpu', -1)
+        for channel in self.channels:
+            channel.begin(clock)
+        sampler = None
+        idle = False
+        last = clock()
+        while not self.quit.value:
+            if m.profiling.value and not sampler:
+                sampler = Sampler()
+                sampler.start()
+            elif sampler and not m.profiling.value:
+                sampler.stop()
+                with open(m.profilePath, 'w') as f:
+                    f.write(sampler.report())
+                sampler = None
+
+            # The next step from every sign that's showing something and
+            # has come to the end of its last one, then wait for the first
+            # of them to be due again
+            now = clock()
+            for channel in self.channels:
+                if channel.due is not None and channel.due > now:
+                    continue
+                weight = channel.row(clock)
+                if weight:
+                    channel.due = sched.after(channel.track, weight)
+                else:
+                    channel.due = None
+                    channel.track.reset()
+            if any(channel.mode != BLANK for channel in self.channels):
+                # (a sign's deadline is dropped while it's blank, so there's
+                # nothing to catch up on after an idle spell)
+                due = [channel.due for channel in self.channels if channel.due is not None]
+                sched.wait(min(due) if due else None)
+                m.set('missed_deadlines', sched.missed)
+                m.set('stalls', sched.stalls)
+                idle = False
+                last = clock()
+            else:
+                if not idle and self.realtime:
+                    self.realtime.idle()
+                idle = True
+                self.sleep(self.IDLE)
+                now = clock()
+                m.inc('blank_seconds', now - last)
+                last = now
+        for channel in self.channels:
+            channel.writer.clear()